@@ -6,10 +6,12 @@ import os
 from datetime import datetime
 
 from a2a.client import A2AClient
-from a2a.types import MessageSendParams, SendMessageRequest, Message, TextPart, AgentCard, Role, Task, JSONRPCError, SendMessageResponse
+from a2a.types import MessageSendParams, SendMessageRequest, SendStreamingMessageRequest, Message, TextPart, AgentCard, Role, Task, JSONRPCError, SendMessageResponse, TaskArtifactUpdateEvent, TaskStatusUpdateEvent
 
 AGENT_BASE_URL = "http://0.0.0.0:9999"
 USER_SESSION_FILE = "user_session.json"
+# Render replies token by token when the agent supports streaming
+STREAMING = os.getenv("BUYER_STREAMING", "true").lower() == "true"
 
 # ANSI color codes
 class Colors:
@@ -40,6 +42,38 @@ def print_error(text):
     """Print error messages in red."""
     print(f"{Colors.RED}Error: {text}{Colors.RESET}")
 
+def part_text(parts):
+    """Join the text of a list of A2A parts."""
+    return "".join(part.root.text for part in parts or [] if hasattr(part, 'root') and getattr(part.root, 'text', None))
+
+async def send_message_streaming(client, task_id, user_message):
+    """Send a message over message/stream and print the reply as it arrives."""
+    request = SendStreamingMessageRequest(
+        id=task_id,
+        params=MessageSendParams(message=user_message)
+    )
+    started = False
+    async for response in client.send_message_streaming(request):
+        if hasattr(response.root, 'error'):
+            print_error(response.root.error.message)
+            break
+        event = response.root.result
+        if isinstance(event, TaskArtifactUpdateEvent):
+            text = part_text(event.artifact.parts)
+            if event.append:
+                print(f"{Colors.GREEN}{text}{Colors.RESET}", end="", flush=True)
+            elif not started or not event.lastChunk:
+                print(f"\n{Colors.GREEN}Agent: {text}{Colors.RESET}", end="", flush=True)
+            # A closing chunk that is not appended repeats the whole reply, which is already on screen
+            started = True
+            if event.lastChunk:
+                print()
+        elif isinstance(event, TaskStatusUpdateEvent):
+            if event.status.state.value == "failed":
+                print_error(f"Agent failed: {part_text(event.status.message.parts) if event.status.message else 'Unknown error.'}")
+            if event.final:
+                break
+
 class PersistentBuyerClient:
     def __init__(self):
         self.user_id = None
@@ -155,6 +189,10 @@ async def run_client():
                     )
                 )
 
+                if STREAMING and agent_card.capabilities.streaming:
+                    await send_message_streaming(client, task_id, user_message)
+                    continue
+
                 # print_status("Sending request...")
                 response = await client.send_message(request)
 
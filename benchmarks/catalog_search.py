@@ -0,0 +1,64 @@
+"""Compare the old linear substring scan with ProductCatalog.search on a synthetic catalog.
+
+Run from the repository root:
+
+    python benchmarks/catalog_search.py [num_skus]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from catalog import ProductCatalog  # noqa: E402
+
+
+ADJECTIVES = ["Wireless", "Portable", "Gaming", "Smart", "Compact", "Premium", "Ergonomic", "Rugged", "Slim", "Mini"]
+PRODUCTS = ["Headphones", "Keyboard", "Mouse", "Speaker", "Charger", "Power Bank", "Laptop Stand", "Webcam",
+            "Monitor", "Phone Case", "Cable", "Hub", "Microphone", "Tablet", "Smartwatch"]
+BRANDS = ["Acme", "Zentro", "Volta", "Nimbus", "Orbit", "Kestrel", "Lumen", "Quasar"]
+QUERIES = ["headphone", "Gaming Keyboard", "powerbank", "speakers", "keybord", "usb hub", "Nimbus webcam", "stand"]
+
+
+def synthetic_items(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i + 1,
+            "name": f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {rng.choice(PRODUCTS)} {rng.randint(1, 999)}",
+            "price": round(rng.uniform(5, 300), 2),
+            "stock": rng.randint(0, 100),
+        }
+        for i in range(count)
+    ]
+
+
+def linear_search(items, product_name):
+    return [item for item in items if product_name.lower() in item["name"].lower()]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    items = synthetic_items(count)
+
+    start = time.perf_counter()
+    catalog = ProductCatalog(items)
+    print(f"Indexed {count} SKUs in {(time.perf_counter() - start) * 1000:.0f} ms\n")
+
+    print(f"{'query':<18} {'linear ms':>10} {'hits':>7} {'catalog ms':>11} {'hits':>5}")
+    for query in QUERIES:
+        linear_ms, linear_hits = timed(lambda: linear_search(items, query), 20)
+        catalog_ms, catalog_hits = timed(lambda: catalog.search(query, limit=10), 20)
+        print(f"{query:<18} {linear_ms:>10.2f} {len(linear_hits):>7} {catalog_ms:>11.2f} {len(catalog_hits):>5}")
+
+
+if __name__ == "__main__":
+    main()
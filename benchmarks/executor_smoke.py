@@ -0,0 +1,149 @@
+"""Smoke-run RetailerAgentExecutor through the installed a2a-sdk and google-adk, without calling the model.
+
+Requests go through a2a's DefaultRequestHandler exactly as the server sends
+them, so any mismatch between the executor and the pinned SDK signatures
+fails here rather than on every live request. The ADK runner's model run is
+replaced with a scripted one. The script checks three things:
+
+- a routed "show me inventory" completes with the inventory listing
+- a streamed model reply arrives as appended chunks and ends as one artifact
+- cancelling a running task releases its reservation and ends it canceled
+
+Run from the repository root:
+
+    python benchmarks/executor_smoke.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Importing agent builds the global memory in the working directory, so do that somewhere disposable
+os.chdir(tempfile.mkdtemp(prefix="executor_smoke_"))
+
+from a2a.server.request_handlers import DefaultRequestHandler  # noqa: E402
+from a2a.server.tasks import InMemoryTaskStore  # noqa: E402
+from a2a.types import (  # noqa: E402
+    Message,
+    MessageSendParams,
+    Part,
+    Role,
+    TaskArtifactUpdateEvent,
+    TaskIdParams,
+    TaskState,
+    TaskStatusUpdateEvent,
+    TextPart,
+)
+from google.adk.events import Event  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import agent  # noqa: E402
+from agent_executor import RetailerAgentExecutor  # noqa: E402
+from intent_router import create_intent_router  # noqa: E402
+
+REPLY_CHUNKS = ["We have ", "wireless headphones ", "for $79.99."]
+
+
+def model_event(text, partial):
+    return Event(
+        author=agent.Retailer_Root_Agent.name,
+        partial=partial,
+        content=types.Content(role="model", parts=[types.Part(text=text)]),
+    )
+
+
+async def streamed_reply(**kwargs):
+    for chunk in REPLY_CHUNKS:
+        yield model_event(chunk, partial=True)
+    yield model_event("".join(REPLY_CHUNKS), partial=False)
+
+
+started = asyncio.Event()
+
+
+async def slow_reply_holding_stock(user_id, **kwargs):
+    await agent.get_payment_info("polygon", user_id, "smoke", product_id=1, quantity=2)
+    started.set()
+    await asyncio.sleep(60)  # Stands in for a slow model call or RPC request
+    yield model_event("never sent", partial=False)
+
+
+def message(text):
+    return MessageSendParams(message=Message(
+        role=Role.user, parts=[Part(root=TextPart(text=text))], messageId=str(uuid.uuid4()),
+    ))
+
+
+def check(failures, ok, description):
+    print(f"{'ok  ' if ok else 'FAIL'} {description}")
+    if not ok:
+        failures.append(description)
+
+
+async def main():
+    executor = RetailerAgentExecutor(agent.Retailer_Root_Agent, intent_router=create_intent_router())
+    task_store = InMemoryTaskStore()
+    handler = DefaultRequestHandler(agent_executor=executor, task_store=task_store)
+    failures = []
+
+    # Answered by the intent router, no model run at all
+    task = await handler.on_message_send(message("show me inventory"))
+    text = task.artifacts[0].parts[0].root.text if task.artifacts else ""
+    check(failures, task.status.state == TaskState.completed and "Current Inventory" in text,
+          f"routed request completes with the inventory ({task.status.state})")
+
+    # Streamed model reply
+    executor.runner.run_async = streamed_reply
+    chunks = []
+    task_id = None
+    async for event in handler.on_message_send_stream(message("tell me about your headphones")):
+        if isinstance(event, TaskArtifactUpdateEvent):
+            task_id = event.taskId
+            chunks.append((event.artifact.parts[0].root.text, event.append, event.lastChunk))
+    expected = [(chunk, index > 0, False) for index, chunk in enumerate(REPLY_CHUNKS)]
+    check(failures, chunks[:-1] == expected, "model output streams as appended chunks")
+    check(failures, chunks[-1:] == [("".join(REPLY_CHUNKS) + "\n", False, True)],
+          "the last chunk replaces the stream with the full reply")
+    task = await task_store.get(task_id)
+    check(failures, task.status.state == TaskState.completed and len(task.artifacts) == 1
+          and [part.root.text for part in task.artifacts[0].parts] == ["".join(REPLY_CHUNKS) + "\n"],
+          "the finished task holds the reply as a single part")
+
+    # Cancel a run that is holding stock
+    executor.runner.run_async = slow_reply_holding_stock
+    available = agent.reservation_engine.available(1)
+    stream = handler.on_message_send_stream(message("I want two headphones"))
+    first = await anext(stream)
+    task_id = first.id
+    drain = asyncio.create_task(_drain(stream))
+    await asyncio.wait_for(started.wait(), 10)
+    held = agent.reservation_engine.available(1)
+    task = await asyncio.wait_for(handler.on_cancel_task(TaskIdParams(id=task_id)), 10)
+    statuses = await asyncio.wait_for(drain, 10)
+    check(failures, held == available - 2 and agent.reservation_engine.available(1) == available,
+          f"cancelling releases the reserved stock ({available} -> {held} -> {agent.reservation_engine.available(1)})")
+    check(failures, task.status.state == TaskState.canceled, f"cancelled task ends canceled ({task.status.state})")
+    check(failures, TaskState.canceled in statuses, "the stream reports the canceled state")
+
+    print("\nFAIL" if failures else "\nOK: executor works with the installed SDKs")
+    sys.exit(1 if failures else 0)
+
+
+async def _drain(stream):
+    states = []
+    try:
+        async for event in stream:
+            if isinstance(event, TaskStatusUpdateEvent):
+                states.append(event.status.state)
+    except asyncio.CancelledError:
+        # on_cancel_task also cancels the handler's producer task, and the stream
+        # re-raises that while cleaning up after the final event
+        pass
+    return states
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""Stress ConversationMemory with several worker processes and threads writing the same sessions.
+
+Every process opens the same journal with MEMORY_MULTIPROCESS=true, as
+uvicorn workers would. Each thread repeatedly picks one of a handful of
+shared sessions and adds a payment request, a preference and a
+conversation turn to it, then marks each of its payments paid. Sessions
+are kept few and the resident limit small so writers collide, sessions
+are paged in and out, and the journal is compacted many times mid-run.
+Afterwards the memory is reopened from disk and the script checks that
+every payment, status update and preference survived.
+
+Run from the repository root:
+
+    python benchmarks/memory_stress.py [processes] [threads] [operations per thread] [sessions]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Importing agent builds the global memory in the working directory, so do that somewhere disposable
+WORKDIR = tempfile.mkdtemp(prefix="memory_stress_")
+os.chdir(WORKDIR)
+os.environ.update({
+    "MEMORY_BACKEND": "journal",
+    "MEMORY_MULTIPROCESS": "true",
+    "MEMORY_FLUSH_MODE": "sync",
+    "MEMORY_JOURNAL_COMPACT_MIN_BYTES": "16384",
+})
+
+from agent import ConversationMemory  # noqa: E402
+
+MEMORY_FILE = os.path.join(WORKDIR, "stress_memory.json")
+
+
+def session_for(worker, thread, op, sessions):
+    return f"stress_{(worker * 7 + thread * 3 + op) % sessions}"
+
+
+def writer(memory, worker, thread, operations, sessions):
+    for op in range(operations):
+        session_id = session_for(worker, thread, op, sessions)
+        tag = f"{worker}-{thread}-{op}"
+        memory.add_payment_request(session_id, {"payment_id": tag, "status": "pending"})
+        memory.add_user_preference(session_id, tag, op)
+        memory.update_session_memory(session_id, f"query {tag}", f"response {tag}", {"user_id": "stress"})
+    for op in range(operations):
+        tag = f"{worker}-{thread}-{op}"
+        if not memory.update_payment_request(session_for(worker, thread, op, sessions), tag, {"status": "paid"}):
+            print(f"payment {tag} missing when marking it paid")
+
+
+def worker(index, threads, operations, sessions):
+    memory = ConversationMemory(MEMORY_FILE, max_resident_sessions=max(1, sessions // 2))
+    pool = [
+        threading.Thread(target=writer, args=(memory, index, thread, operations, sessions))
+        for thread in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    memory.close()
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    operations = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    sessions = int(sys.argv[4]) if len(sys.argv) > 4 else 6
+
+    start = time.perf_counter()
+    workers = [
+        multiprocessing.Process(target=worker, args=(index, threads, operations, sessions))
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - start
+    writes = processes * threads * operations * 4
+
+    memory = ConversationMemory(MEMORY_FILE)
+    payments = {}
+    preferences = set()
+    for index in range(sessions):
+        session = memory.get_session_memory(f"stress_{index}")
+        for payment in session["payment_requests"]:
+            count, _ = payments.get(payment["payment_id"], (0, None))
+            payments[payment["payment_id"]] = (count + 1, payment["status"])
+        preferences.update(session["user_preferences"])
+    memory.close()
+
+    expected = {f"{w}-{t}-{o}" for w in range(processes) for t in range(threads) for o in range(operations)}
+    lost_payments = expected - set(payments)
+    duplicated = [tag for tag, (count, _) in payments.items() if count > 1]
+    lost_updates = [tag for tag, (_, status) in payments.items() if status != "paid"]
+    lost_preferences = expected - preferences
+
+    print(f"{processes} processes x {threads} threads x {operations} operations on {sessions} sessions: "
+          f"{writes} writes in {elapsed:.2f}s ({writes / elapsed:,.0f}/s)\n")
+    print(f"payments       expected {len(expected):>6}  found {len(payments):>6}  lost {len(lost_payments)}  "
+          f"duplicated {len(duplicated)}")
+    print(f"status updates expected {len(expected):>6}  lost {len(lost_updates)}")
+    print(f"preferences    expected {len(expected):>6}  lost {len(lost_preferences)}")
+    failed = lost_payments or duplicated or lost_updates or lost_preferences
+    print("\nFAIL: updates were lost" if failed else "\nOK: no lost updates")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
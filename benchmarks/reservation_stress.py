@@ -0,0 +1,94 @@
+"""Stress ReservationEngine with many concurrent buyers competing for scarce stock.
+
+Each simulated buyer reserves one or two units of a random SKU, then pays
+(commits), abandons the order (lets the hold expire) or cancels it. The
+script checks that no SKU is ever oversold and that every hold is
+accounted for once the run is over.
+
+Run from the repository root:
+
+    python benchmarks/reservation_stress.py [buyers] [threads]
+"""
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from inventory import InventoryStore, StaticInventoryProvider  # noqa: E402
+from reservations import ReservationEngine, ReservationError  # noqa: E402
+
+
+ITEMS = [
+    {"id": 1, "name": "Gaming Keyboard", "price": 89.99, "stock": 12},
+    {"id": 2, "name": "Bluetooth Speaker", "price": 59.99, "stock": 15},
+    {"id": 3, "name": "Laptop Stand", "price": 45.99, "stock": 1},
+]
+TTL_SECONDS = 0.05
+
+
+def buyer(engine, rng_seed, outcomes, sold_units, lock):
+    rng = random.Random(rng_seed)
+    reservation_id = uuid.uuid4().hex
+    item_id = rng.choice(ITEMS)["id"]
+    quantity = rng.choice((1, 1, 2))
+    try:
+        engine.reserve(reservation_id, item_id, quantity)
+    except ReservationError:
+        outcome = "rejected"
+    else:
+        action = rng.random()
+        if action < 0.5:
+            outcome = "sold" if engine.commit(reservation_id) else "late"
+        elif action < 0.8:
+            # Abandoned checkout; a few buyers pay after their hold has lapsed
+            time.sleep(TTL_SECONDS * rng.uniform(0.5, 2))
+            if rng.random() < 0.3:
+                outcome = "sold" if engine.commit(reservation_id) else "late"
+            else:
+                outcome = "abandoned"
+        else:
+            engine.release(reservation_id)
+            outcome = "cancelled"
+    with lock:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if outcome == "sold":
+            sold_units[item_id] = sold_units.get(item_id, 0) + quantity
+
+
+def main():
+    buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    store = InventoryStore(StaticInventoryProvider(ITEMS), poll_interval=0)
+    engine = ReservationEngine(store, ttl_seconds=TTL_SECONDS)
+
+    outcomes = {}
+    sold_units = {}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i in range(buyers):
+            pool.submit(buyer, engine, i, outcomes, sold_units, lock)
+    elapsed = time.perf_counter() - start
+
+    time.sleep(TTL_SECONDS * 2)
+    engine.expire_due()
+
+    print(f"{buyers} buyers on {threads} threads in {elapsed:.2f}s: {dict(sorted(outcomes.items()))}\n")
+    oversold = False
+    for item in ITEMS:
+        sold = sold_units.get(item["id"], 0)
+        held = engine._held.get(item["id"], 0)
+        print(f"{item['name']:<18} stock {item['stock']:>3}  sold {sold:>3}  still held {held}  "
+              f"available {engine.available(item['id'])}")
+        oversold |= sold > item["stock"] or held != 0
+    print("\nFAIL: stock oversold or holds leaked" if oversold else "\nOK: no SKU oversold")
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == "__main__":
+    main()
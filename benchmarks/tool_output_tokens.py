@@ -0,0 +1,85 @@
+"""Compare the size of markdown and JSON tool results fed back to the model.
+
+No Gemini tokenizer ships with the project, so tokens are estimated by
+counting words, numbers and runs of punctuation/emoji, which is close
+enough to a BPE/SentencePiece count for a relative comparison. tiktoken is
+used instead when it is installed.
+
+Run from the repository root:
+
+    python benchmarks/tool_output_tokens.py [num_skus]
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import tool_results  # noqa: E402
+from catalog_search import synthetic_items  # noqa: E402
+from inventory import InventoryStore, StaticInventoryProvider  # noqa: E402
+from rendering import ResponseRenderer  # noqa: E402
+from reservations import ReservationEngine  # noqa: E402
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except ImportError:
+    _PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\w\s]+")
+
+    def count_tokens(text):
+        return len(_PIECE_RE.findall(text))
+
+
+PAYMENT_CONFIG = {
+    "supported_networks": {
+        "polygon": {
+            "name": "Polygon (MATIC)",
+            "chain_id": 137,
+            "wallet_address": "0x742e4c5b8f8de8a3d51b4e4a8d2f6e9c1a3b5d7e",
+            "usdc_contract": "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174",
+            "network_fee": "Low",
+            "confirmation_time": "2-5 minutes",
+        },
+    },
+    "default_network": "polygon",
+    "minimum_payment": 1.00,
+    "payment_timeout": "30 minutes",
+}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    store = InventoryStore(StaticInventoryProvider(synthetic_items(count)), poll_interval=0)
+    engine = ReservationEngine(store, ttl_seconds=1800)
+    renderer = ResponseRenderer(PAYMENT_CONFIG, store, engine)
+    items = store.items()
+
+    full_page = tool_results.item_page(items, engine.available, limit=len(items))
+    first_page = tool_results.item_page(items, engine.available, limit=50)
+    cases = [
+        # Before: check_inventory always dumped the whole catalog as markdown
+        ("check_inventory, full listing vs default page", renderer.inventory(), tool_results.to_json(first_page)),
+        ("check_inventory, page of 50", renderer.inventory_page(first_page), tool_results.to_json(first_page)),
+        (f"check_inventory, page of {len(full_page['rows'])}", renderer.inventory_page(full_page),
+         tool_results.to_json(full_page)),
+        ("check_inventory, page of 50, fields=name,price", renderer.inventory_page(first_page),
+         tool_results.to_json(tool_results.item_page(items, engine.available, ("name", "price"), limit=50))),
+        ("get_payment_info(polygon)", renderer.payment_info("polygon"),
+         tool_results.to_json(renderer.payment_info_data("polygon"))),
+        ("get_supported_networks", renderer.supported_networks(),
+         tool_results.to_json(renderer.supported_networks_data())),
+    ]
+
+    print(f"{'tool result':<48} {'markdown':>9} {'json':>7} {'saved':>6}")
+    for name, markdown, structured in cases:
+        markdown_tokens, json_tokens = count_tokens(markdown), count_tokens(structured)
+        saved = 1 - json_tokens / markdown_tokens
+        print(f"{name:<48} {markdown_tokens:>9} {json_tokens:>7} {saved:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 # __ main.py usually contains the main entry point agent.
 
+import os
+
 import uvicorn
+from starlette.responses import JSONResponse
 
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
@@ -14,11 +17,16 @@ from a2a.types import (
 from dotenv import load_dotenv
 load_dotenv()
 
+from adk_sessions import create_session_service
 from agent_executor import (
     RetailerAgentExecutor,
 )
 
-from agent import Retailer_Root_Agent
+from intent_router import create_intent_router
+from response_cache import create_response_cache
+from agent import Retailer_Root_Agent, PAYMENT_CONFIG, conversation_memory, inventory_store, memory_sweeper, payment_ledger, record_watched_payment
+from payment_watcher import PaymentWatcher
+from rpc import rpc_registry
 
 if __name__ == '__main__':
     # Skills for the retailer agent
@@ -73,9 +81,21 @@ if __name__ == '__main__':
         }
     )
 
+    # ADK sessions persisted next to conversation memory, so turns carry over across restarts
+    adk_session_service = create_session_service()
+
+    # Canned inventory and payment requests answered without a model round-trip
+    intent_router = create_intent_router() if os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true' else None
+    # Model replies to repeated opening questions, reused until stock, prices or payment config change
+    response_cache = create_response_cache()
+
     request_handler = DefaultRequestHandler(
         agent_executor=RetailerAgentExecutor(
             agent=Retailer_Root_Agent,
+            session_service=adk_session_service,
+            streaming=os.getenv('AGENT_STREAMING', 'true').lower() == 'true',
+            intent_router=intent_router,
+            response_cache=response_cache,
         ),
         task_store=InMemoryTaskStore(),
     )
@@ -86,4 +106,59 @@ if __name__ == '__main__':
         extended_agent_card=specific_extended_agent_card,
     )
 
-    uvicorn.run(server.build(), host='0.0.0.0', port=9999)
\ No newline at end of file
+    app = server.build()
+
+    async def memory_metrics(request):
+        return JSONResponse({
+            **conversation_memory.memory_stats(),
+            "retention": memory_sweeper.stats,
+            "adk_sessions": adk_session_service.stats(),
+        })
+
+    # Resident vs stored sessions, cache hit rate and process RSS
+    app.add_route('/metrics/memory', memory_metrics, methods=['GET'])
+
+    async def intent_metrics(request):
+        return JSONResponse(intent_router.stats() if intent_router else {"enabled": False})
+
+    # How many messages the intent router answered without the model
+    app.add_route('/metrics/intents', intent_metrics, methods=['GET'])
+
+    async def cache_metrics(request):
+        return JSONResponse(response_cache.stats() if response_cache else {"enabled": False})
+
+    # Response cache hits, misses and invalidations
+    app.add_route('/metrics/response_cache', cache_metrics, methods=['GET'])
+
+    # Shutdown handlers run in registration order: the background tasks below
+    # are stopped first, and the stores they write to are closed last
+
+    # Expire idle sessions and archive old payment records in small batches
+    app.add_event_handler('startup', memory_sweeper.start)
+    app.add_event_handler('shutdown', memory_sweeper.stop)
+
+    # Pick up inventory price and stock changes without a restart
+    app.add_event_handler('startup', inventory_store.start)
+    app.add_event_handler('shutdown', inventory_store.stop)
+
+    # Watch the chain for incoming USDC transfers and settle pending payment requests
+    if os.getenv('PAYMENT_WATCHER_ENABLED', 'true').lower() == 'true':
+        payment_watcher = PaymentWatcher(
+            PAYMENT_CONFIG,
+            payment_ledger,
+            on_payment=record_watched_payment,
+            poll_interval=float(os.getenv('PAYMENT_WATCHER_POLL_SECONDS', '15')),
+            confirmations=int(os.getenv('PAYMENT_WATCHER_CONFIRMATIONS', '3')),
+            max_block_range=int(os.getenv('PAYMENT_WATCHER_MAX_BLOCK_RANGE', '500')),
+        )
+        app.add_event_handler('startup', payment_watcher.start)
+        app.add_event_handler('shutdown', payment_watcher.stop)
+
+    # Flush buffered conversation memory before the process exits
+    app.add_event_handler('shutdown', conversation_memory.close)
+    app.add_event_handler('shutdown', adk_session_service.close)
+    app.add_event_handler('shutdown', payment_ledger.close)
+    # Close pooled RPC connections
+    app.add_event_handler('shutdown', rpc_registry.close)
+
+    uvicorn.run(app, host='0.0.0.0', port=9999)
\ No newline at end of file
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+from memory_store import create_memory_store
+
+
+class PersistentSessionService(BaseSessionService):
+    """ADK session service that keeps live sessions in a bounded LRU and persists them to a MemoryStore.
+
+    The runner gets the same Session object back on every turn while it is
+    live, so a conversation's events and state carry over without being
+    rebuilt through tool calls. Each appended event is written through to
+    the store, so up to ``max_live_sessions`` sessions stay in RAM and the
+    rest, including everything from before a restart, are read back on
+    demand. Sessions keep at most about ``max_events`` events: whole turns
+    are dropped from the front, never splitting a tool call from its
+    response, which also bounds the prompt the model is sent. When the
+    store is shared between worker processes, sessions another worker
+    changed are dropped from the LRU and reloaded.
+    """
+
+    def __init__(self, store, max_live_sessions=1000, max_events=60):
+        self.store = store
+        self.max_live_sessions = max_live_sessions
+        self.max_events = max_events
+        self._live = OrderedDict()  # Store key -> Session, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.store.open()
+
+    @staticmethod
+    def _key(app_name, user_id, session_id):
+        return json.dumps([app_name, user_id, session_id])
+
+    def _remember(self, key, session):
+        self._live[key] = session
+        self._live.move_to_end(key)
+        # Every event is already persisted, so dropping a session from the LRU loses nothing
+        while self.max_live_sessions and len(self._live) > self.max_live_sessions:
+            self._live.popitem(last=False)
+
+    async def _persist(self, key, session):
+        await asyncio.to_thread(self.store.save_session, key, session.model_dump(mode="json", exclude_none=True))
+
+    async def _refresh(self):
+        """Forget live copies of sessions other worker processes changed."""
+        for key in await asyncio.to_thread(self.store.refresh):
+            self._live.pop(key, None)
+
+    async def create_session(self, *, app_name, user_id, state=None, session_id=None):
+        session_id = session_id or str(uuid.uuid4())
+        key = self._key(app_name, user_id, session_id)
+        await self._refresh()
+        if key in self._live or await asyncio.to_thread(self.store.has_session, key):
+            raise ValueError(f"Session {session_id} already exists")
+        session = Session(app_name=app_name, user_id=user_id, id=session_id, state=state or {})
+        self._remember(key, session)
+        await self._persist(key, session)
+        return session
+
+    async def get_session(self, *, app_name, user_id, session_id, config: GetSessionConfig = None):
+        key = self._key(app_name, user_id, session_id)
+        await self._refresh()
+        session = self._live.get(key)
+        if session is not None:
+            self._live.move_to_end(key)
+            self.hits += 1
+        else:
+            data = await asyncio.to_thread(self.store.load_session, key)
+            if data is None:
+                return None
+            self.misses += 1
+            session = Session.model_validate(data)
+            self._remember(key, session)
+
+        if config is None:
+            return session
+        # A filtered view for the caller; the live session keeps every event
+        events = session.events
+        if config.after_timestamp:
+            events = [event for event in events if event.timestamp >= config.after_timestamp]
+        if config.num_recent_events:
+            events = events[-config.num_recent_events:]
+        return session.model_copy(update={"events": events})
+
+    async def list_sessions(self, *, app_name, user_id):
+        sessions = []
+        for key in await asyncio.to_thread(self.store.session_ids):
+            if json.loads(key)[:2] != [app_name, user_id]:
+                continue
+            data = await asyncio.to_thread(self.store.load_session, key)
+            if data is not None:
+                sessions.append(Session.model_validate({**data, "events": []}))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name, user_id, session_id):
+        key = self._key(app_name, user_id, session_id)
+        self._live.pop(key, None)
+        await asyncio.to_thread(self.store.delete_session, key)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        if event.author == "user":
+            self._trim_events(session)
+        key = self._key(session.app_name, session.user_id, session.id)
+        self._remember(key, session)
+        await self._persist(key, session)
+        return event
+
+    def _trim_events(self, session):
+        """Drop the oldest whole turns once a session holds more than max_events events."""
+        excess = len(session.events) - self.max_events
+        if not self.max_events or excess <= 0:
+            return
+        # Cut where a user turn starts so no function call loses its response
+        for index in range(excess, len(session.events)):
+            if session.events[index].author == "user":
+                del session.events[:index]
+                return
+
+    def stats(self):
+        return {"live_sessions": len(self._live), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.store.close()
+
+
+def create_session_service():
+    """Build the ADK session service selected by the ADK_SESSION_* environment variables."""
+    # The sqlite backend only covers conversation memory; ADK sessions then use the journal
+    backend = os.getenv("MEMORY_BACKEND", "journal").lower()
+    store = create_memory_store(
+        os.getenv("ADK_SESSION_FILE", "adk_sessions.json"),
+        backend="journal" if backend == "sqlite" else backend,
+    )
+    return PersistentSessionService(
+        store,
+        max_live_sessions=int(os.getenv("ADK_MAX_LIVE_SESSIONS", "1000")),
+        max_events=int(os.getenv("ADK_SESSION_MAX_EVENTS", "60")),
+    )
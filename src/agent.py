@@ -1,32 +1,49 @@
 from google.adk.agents import Agent
 from google.adk.tools import google_search, FunctionTool
+import asyncio
+import contextvars
 import json
 import os
-from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
 import hashlib
+import uuid
 
-from web3 import Web3
 import requests
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from blob_store import MIN_COMPRESSED_CHARS, BlobStore, compress_text, decompress_text
+from memory_store import SessionCache, create_memory_store, infer_session_owner, process_rss_bytes
+from sqlite_memory import SqliteConversationMemory
+import payments
+from inventory import InventoryStore, create_inventory_provider
+from payment_ledger import PaymentLedger
+from payment_watcher import AMOUNT_TOLERANCE_USDC
+from reservations import ReservationEngine, ReservationError
+from retention import MemorySweeper, PaymentArchive, RetentionPolicy, session_last_active
+from rendering import ResponseRenderer
+import tool_results
+
 
 RETAILER_WALLET_ADDRESS = os.getenv("AGENT_RETAILER_ONCHAIN_WALLET")  
 print(f"Retailer Wallet Address: {RETAILER_WALLET_ADDRESS}")
 
-# Inventory data
+# Built-in demo inventory, used when INVENTORY_SOURCE is not set
 INVENTORY_ITEMS = [
-    {"id": 1, "name": "Wireless Bluetooth Headphones", "price": 79.99, "stock": 25},
-    {"id": 2, "name": "Smartphone Case (iPhone)", "price": 24.99, "stock": 50},
-    {"id": 3, "name": "USB-C Charging Cable", "price": 12.99, "stock": 100},
-    {"id": 4, "name": "Portable Power Bank 10000mAh", "price": 34.99, "stock": 30},
-    {"id": 5, "name": "Bluetooth Speaker", "price": 59.99, "stock": 15},
-    {"id": 6, "name": "Laptop Stand", "price": 45.99, "stock": 20},
-    {"id": 7, "name": "Wireless Mouse", "price": 29.99, "stock": 40},
-    {"id": 8, "name": "Screen Protector", "price": 9.99, "stock": 75},
-    {"id": 9, "name": "Car Phone Mount", "price": 19.99, "stock": 35},
-    {"id": 10, "name": "Gaming Keyboard", "price": 89.99, "stock": 12}
+    {"id": 1, "name": "Wireless Bluetooth Headphones", "category": "audio", "price": 79.99, "stock": 25},
+    {"id": 2, "name": "Smartphone Case (iPhone)", "category": "phone accessories", "price": 24.99, "stock": 50},
+    {"id": 3, "name": "USB-C Charging Cable", "category": "charging", "price": 12.99, "stock": 100},
+    {"id": 4, "name": "Portable Power Bank 10000mAh", "category": "charging", "price": 34.99, "stock": 30},
+    {"id": 5, "name": "Bluetooth Speaker", "category": "audio", "price": 59.99, "stock": 15},
+    {"id": 6, "name": "Laptop Stand", "category": "computer accessories", "price": 45.99, "stock": 20},
+    {"id": 7, "name": "Wireless Mouse", "category": "computer accessories", "price": 29.99, "stock": 40},
+    {"id": 8, "name": "Screen Protector", "category": "phone accessories", "price": 9.99, "stock": 75},
+    {"id": 9, "name": "Car Phone Mount", "category": "phone accessories", "price": 19.99, "stock": 35},
+    {"id": 10, "name": "Gaming Keyboard", "category": "computer accessories", "price": 89.99, "stock": 12}
 ]
 
 # Payment configuration
@@ -62,216 +79,620 @@ PAYMENT_CONFIG = {
     "payment_timeout": "30 minutes"
 }
 
+# markdown (default) returns formatted text from tools; json returns compact
+# structured results that the model formats once in its reply
+TOOL_OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", "markdown").lower()
+if TOOL_OUTPUT_FORMAT not in tool_results.OUTPUT_FORMATS:
+    raise ValueError(f"Unsupported TOOL_OUTPUT_FORMAT: {TOOL_OUTPUT_FORMAT}")
+
+# Number of recent conversation summaries kept per user for cross-session context
+RECENT_CONVERSATIONS_PER_USER = 50
+
+# Tool calls kept per session; their results live in the blob store
+MAX_TOOL_CALLS_PER_SESSION = 15
+
 class ConversationMemory:
-    def __init__(self, memory_file="conversation_memory.json"):
+    """Conversation memory kept in a storage backend, with a bounded working set in RAM.
+
+    ``memory`` holds at most ``max_resident_sessions`` sessions in LRU order
+    and reads colder ones back from the store when they are accessed again.
+    Per-user state (the active session and the ring of recent conversation
+    summaries) is likewise kept for at most ``max_resident_users`` users;
+    a user's ring is rebuilt from their sessions when they come back. A
+    limit of 0 means unbounded. Only the session -> owner index stays fully
+    in memory.
+
+    Sessions are kept compact: long agent responses are stored
+    zlib-compressed, and tool calls are recorded as (tool, args, result
+    reference) with the result text deduplicated in a content-addressed
+    BlobStore.
+
+    Every read-modify-write of a session runs under that session's lock
+    from the store, so tools running concurrently with the executor never
+    lose each other's updates, and ``lock`` is only held briefly for the
+    shared indexes. When the store is shared between worker processes the
+    session lock excludes the other workers too, and changes they made are
+    picked up before the session is read.
+    """
+
+    def __init__(self, memory_file="conversation_memory.json", store=None,
+                 max_resident_sessions=0, max_resident_users=0, blob_store=None):
         self.memory_file = memory_file
-        self.memory = self._load_memory()
-        self.user_sessions = {}  # Maps user_id to current session_id
-    
-    def _load_memory(self):
-        """Load conversation memory from file."""
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r') as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
-    
-    def _save_memory(self):
-        """Save conversation memory to file."""
+        self.store = store or create_memory_store(memory_file)
+        self.blob_store = blob_store or BlobStore(f"{memory_file}.blobs")
+        self.lock = self.store.lock  # Guards the session cache and the per-user indexes below
+        self._open_store()
+        self.memory = SessionCache(self.store, max_resident_sessions)
+        self.max_resident_users = max_resident_users
+        self.user_sessions = OrderedDict()  # Maps user_id to current session_id, least recently used first
+        self.session_owners = {}  # Maps session_id to the user_id that owns it
+        self.user_index = {}  # Maps user_id to its session_ids, oldest first
+        self.recent_conversations = OrderedDict()  # Maps user_id to a ring of recent conversation summaries
+        self._sweep_queue = deque()  # Session ids the retention sweeper has yet to visit this round
+        self._build_user_index()
+    
+    def _open_store(self):
+        """Open the storage backend so sessions can be loaded on demand."""
+        try:
+            self.store.open()
+        except Exception as e:
+            print(f"Error loading memory: {e}")
+    
+    def _save_session(self, session_id, session_data):
+        """Persist a single session to the storage backend; the caller holds its session lock."""
         try:
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.memory, f, indent=2)
+            self.store.save_session(session_id, session_data)
         except Exception as e:
             print(f"Error saving memory: {e}")
     
+    @contextmanager
+    def _locked_session(self, session_id, create=True):
+        """Hold a session's lock and yield its current data, or None if it does not exist and create is False."""
+        with self.store.session_lock(session_id):
+            with self.lock:
+                self._refresh()
+                session_data = self._ensure_session(session_id) if create else self.memory.get(session_id)
+            yield session_data
+    
+    def _refresh(self):
+        """Catch up with sessions other worker processes changed; the caller holds lock."""
+        for session_id in self.store.refresh():
+            self.memory.invalidate(session_id)
+            if session_id not in self.memory:
+                self._forget_session(session_id)
+                continue
+            user_id = self.session_owners.get(session_id)
+            if user_id is None:
+                user_id = infer_session_owner(session_id, self.memory.peek(session_id) or {})
+                if user_id:
+                    self._index_session(user_id, session_id)
+            # Rebuilt from the sessions on next use
+            self.recent_conversations.pop(user_id, None)
+    
+    def _build_user_index(self):
+        """Rebuild the user -> sessions index by streaming every stored session once."""
+        for session_id, session_data in self.store.scan():
+            user_id = infer_session_owner(session_id, session_data)
+            if user_id:
+                self._index_session(user_id, session_id)
+    
+    def _recent_for(self, user_id):
+        """Return a user's ring of recent conversation summaries, rebuilding it if it was dropped."""
+        recent = self.recent_conversations.get(user_id)
+        if recent is not None:
+            self.recent_conversations.move_to_end(user_id)
+            return recent
+        conversations = []
+        for session_id in self.user_index.get(user_id, ()):
+            session_data = self.memory.peek(session_id)
+            for conv in (session_data or {}).get("conversation_history", []):
+                conversations.append(self._summarize_conversation(session_id, conv))
+        conversations.sort(key=lambda x: x["timestamp"])
+        recent = deque(conversations, maxlen=RECENT_CONVERSATIONS_PER_USER)
+        self.recent_conversations[user_id] = recent
+        self._trim_users(self.recent_conversations)
+        return recent
+    
+    def _trim_users(self, per_user):
+        """Drop the least recently used users from a per-user LRU dict."""
+        while self.max_resident_users and len(per_user) > self.max_resident_users:
+            per_user.popitem(last=False)
+    
+    @staticmethod
+    def _summarize_conversation(session_id, conv, agent_response=None):
+        if agent_response is None:
+            agent_response = ConversationMemory._expand_conversation(conv)["agent_response"]
+        return {
+            "session_id": session_id,
+            "timestamp": conv["timestamp"],
+            "user_query": conv["user_query"],
+            "agent_response": agent_response[:100] + "..." if len(agent_response) > 100 else agent_response
+        }
+    
+    def _index_session(self, user_id, session_id):
+        """Record that session_id belongs to user_id."""
+        self.session_owners[session_id] = user_id
+        self.user_index.setdefault(user_id, {})[session_id] = True
+    
+    def _ensure_session(self, session_id):
+        """Create an empty session record if it does not exist yet, and mark it active now."""
+        now = datetime.now().isoformat()
+        session_data = self.memory.get(session_id)
+        if session_data is None:
+            session_data = {
+                "conversation_history": [],
+                "user_preferences": {},
+                "past_searches": [],
+                "payment_requests": [],
+                "created_at": now
+            }
+            user_id = self.session_owners.get(session_id)
+            if user_id:
+                session_data["user_id"] = user_id
+            self.memory[session_id] = session_data
+        session_data["last_active"] = now
+        return session_data
+    
+    def _forget_session(self, session_id):
+        """Drop a session from the in-memory indexes; returns the user it belonged to."""
+        user_id = self.session_owners.pop(session_id, None)
+        self.memory.pop(session_id)
+        if user_id:
+            sessions = self.user_index.get(user_id, {})
+            sessions.pop(session_id, None)
+            if not sessions:
+                self.user_index.pop(user_id, None)
+            if self.user_sessions.get(user_id) == session_id:
+                del self.user_sessions[user_id]
+            # Rebuilt from the remaining sessions on next use
+            self.recent_conversations.pop(user_id, None)
+        return user_id
+    
+    def _delete_session(self, session_id, archive, reason):
+        """Remove a session everywhere, archiving its payment records first; returns how many were archived."""
+        session_data = self.memory.peek(session_id) or {}
+        archived = archive.append(
+            session_id, self.session_owners.get(session_id), session_data.get("payment_requests", []), reason
+        )
+        self._forget_session(session_id)
+        self.store.delete_session(session_id)
+        return archived
+    
+    def close(self):
+        """Flush pending writes and close the storage backend."""
+        self.store.close()
+    
     def get_or_create_session_for_user(self, user_id, current_context_id=None):
         """Get existing session for user or create new one."""
-        # Check if user has an active session
-        if user_id in self.user_sessions:
-            existing_session = self.user_sessions[user_id]
-            # Check if session still exists in memory
-            if existing_session in self.memory:
-                return existing_session
-        
-        # Create new session or use current context
-        if current_context_id:
-            session_id = current_context_id
-        else:
-            # Generate a session ID based on user and timestamp
-            session_id = f"{user_id}_{int(datetime.now().timestamp())}"
-        
-        self.user_sessions[user_id] = session_id
-        return session_id
+        with self.lock:
+            self._refresh()
+            # Check if user has an active session
+            if user_id in self.user_sessions:
+                self.user_sessions.move_to_end(user_id)
+                existing_session = self.user_sessions[user_id]
+                # Check if session still exists in memory
+                if existing_session in self.memory:
+                    return existing_session
+            
+            # Create new session or use current context
+            if current_context_id:
+                session_id = current_context_id
+            else:
+                # Generate a session ID based on user and timestamp
+                session_id = f"{user_id}_{int(datetime.now().timestamp())}"
+            
+            self.set_active_session(user_id, session_id)
+            return session_id
     
     def get_session_memory(self, session_id):
-        """Get memory for a specific session."""
-        return self.memory.get(session_id, {
-            "conversation_history": [],
-            "user_preferences": {},
-            "past_searches": [],
-            "payment_requests": [],
-            "created_at": datetime.now().isoformat()
-        })
+        """Get a copy of the memory for a specific session."""
+        with self._locked_session(session_id, create=False) as session_data:
+            if session_data is None:
+                return {
+                    "conversation_history": [],
+                    "user_preferences": {},
+                    "past_searches": [],
+                    "payment_requests": [],
+                    "created_at": datetime.now().isoformat()
+                }
+            # Copy the containers so callers can iterate after the session lock is released
+            session_copy = {key: value.copy() if isinstance(value, (list, dict)) else value
+                            for key, value in session_data.items()}
+        session_copy["conversation_history"] = [
+            self._expand_conversation(conv) for conv in session_copy.get("conversation_history", [])
+        ]
+        return session_copy
+    
+    @staticmethod
+    def _expand_conversation(conv):
+        """Return a conversation entry with a compressed agent response restored to full text."""
+        if "agent_response_z" not in conv:
+            return conv
+        expanded = {key: value for key, value in conv.items() if key != "agent_response_z"}
+        expanded["agent_response"] = decompress_text(conv["agent_response_z"])
+        return expanded
+    
+    def set_active_session(self, user_id, session_id):
+        """Make session_id the current session for user_id."""
+        with self.lock:
+            self.user_sessions[user_id] = session_id
+            self.user_sessions.move_to_end(user_id)
+            self._trim_users(self.user_sessions)
+            if session_id not in self.session_owners:
+                self._index_session(user_id, session_id)
+    
+    def get_user_sessions(self, user_id):
+        """Get the session ids that belong to a user, oldest first."""
+        with self.lock:
+            self._refresh()
+            return list(self.user_index.get(user_id, ()))
     
     def get_user_conversation_history(self, user_id, limit=5):
         """Get recent conversation history across all sessions for a user."""
-        all_conversations = []
-        
-        for session_id, session_data in self.memory.items():
-            if session_id.startswith(user_id) or user_id in session_id:
-                for conv in session_data.get("conversation_history", []):
-                    all_conversations.append({
-                        "session_id": session_id,
-                        "timestamp": conv["timestamp"],
-                        "user_query": conv["user_query"],
-                        "agent_response": conv["agent_response"][:100] + "..." if len(conv["agent_response"]) > 100 else conv["agent_response"]
-                    })
-        
-        # Sort by timestamp and return most recent
-        all_conversations.sort(key=lambda x: x["timestamp"], reverse=True)
-        return all_conversations[:limit]
+        with self.lock:
+            self._refresh()
+            if user_id not in self.user_index:
+                return []
+            return list(islice(reversed(self._recent_for(user_id)), limit))
     
     def update_session_memory(self, session_id, user_query, agent_response, context=None):
         """Update memory for a session."""
-        if session_id not in self.memory:
-            self.memory[session_id] = {
-                "conversation_history": [],
-                "user_preferences": {},
-                "past_searches": [],
-                "payment_requests": [],
-                "created_at": datetime.now().isoformat()
-            }
-        
         # Add to conversation history
-        self.memory[session_id]["conversation_history"].append({
+        conversation = {
             "timestamp": datetime.now().isoformat(),
             "user_query": user_query,
             "agent_response": agent_response,
             "context": context
-        })
+        }
+        if len(agent_response) >= MIN_COMPRESSED_CHARS:
+            del conversation["agent_response"]
+            conversation["agent_response_z"] = compress_text(agent_response)
         
-        # Keep only last 15 conversations to prevent memory bloat
-        if len(self.memory[session_id]["conversation_history"]) > 15:
-            self.memory[session_id]["conversation_history"] = \
-                self.memory[session_id]["conversation_history"][-15:]
+        with self._locked_session(session_id) as session_data:
+            session_data["conversation_history"].append(conversation)
+            
+            # Keep only last 15 conversations to prevent memory bloat
+            if len(session_data["conversation_history"]) > 15:
+                session_data["conversation_history"] = session_data["conversation_history"][-15:]
+            
+            with self.lock:
+                user_id = self.session_owners.get(session_id) or (context or {}).get("user_id")
+                if user_id:
+                    if session_id not in self.session_owners:
+                        self._index_session(user_id, session_id)
+                    session_data.setdefault("user_id", user_id)
+                    if user_id in self.recent_conversations:
+                        self._recent_for(user_id).append(
+                            self._summarize_conversation(session_id, conversation, agent_response)
+                        )
+            
+            self._save_session(session_id, session_data)
+    
+    def record_tool_call(self, session_id, tool_name, args, result):
+        """Record a tool call as (tool, args, result reference) instead of a full conversation turn."""
+        call = {"timestamp": datetime.now().isoformat(), "tool": tool_name, "args": args}
+        if len(result) >= MIN_COMPRESSED_CHARS:
+            call["result_ref"] = self.blob_store.put(result)
+        else:
+            call["result"] = result
         
-        self._save_memory()
+        with self._locked_session(session_id) as session_data:
+            tool_calls = session_data.setdefault("tool_calls", [])
+            tool_calls.append(call)
+            if len(tool_calls) > MAX_TOOL_CALLS_PER_SESSION:
+                session_data["tool_calls"] = tool_calls[-MAX_TOOL_CALLS_PER_SESSION:]
+            self._save_session(session_id, session_data)
+    
+    def get_tool_result(self, call):
+        """Return the full result text of a recorded tool call."""
+        if "result_ref" in call:
+            return self.blob_store.get(call["result_ref"])
+        return call.get("result")
     
     def add_user_preference(self, session_id, preference_key, preference_value):
         """Add or update user preference."""
-        if session_id not in self.memory:
-            self.memory[session_id] = {
-                "conversation_history": [],
-                "user_preferences": {},
-                "past_searches": [],
-                "payment_requests": [],
-                "created_at": datetime.now().isoformat()
-            }
-        
-        self.memory[session_id]["user_preferences"][preference_key] = preference_value
-        self._save_memory()
+        with self._locked_session(session_id) as session_data:
+            session_data["user_preferences"][preference_key] = preference_value
+            self._save_session(session_id, session_data)
     
     def add_search_history(self, session_id, search_term, results_count):
         """Add to search history."""
-        if session_id not in self.memory:
-            self.memory[session_id] = {
-                "conversation_history": [],
-                "user_preferences": {},
-                "past_searches": [],
-                "payment_requests": [],
-                "created_at": datetime.now().isoformat()
-            }
-        
-        self.memory[session_id]["past_searches"].append({
-            "timestamp": datetime.now().isoformat(),
-            "search_term": search_term,
-            "results_count": results_count
-        })
-        
-        # Keep only last 20 searches
-        if len(self.memory[session_id]["past_searches"]) > 20:
-            self.memory[session_id]["past_searches"] = \
-                self.memory[session_id]["past_searches"][-20:]
-        
-        self._save_memory()
+        with self._locked_session(session_id) as session_data:
+            session_data["past_searches"].append({
+                "timestamp": datetime.now().isoformat(),
+                "search_term": search_term,
+                "results_count": results_count
+            })
+            
+            # Keep only last 20 searches
+            if len(session_data["past_searches"]) > 20:
+                session_data["past_searches"] = session_data["past_searches"][-20:]
+            
+            self._save_session(session_id, session_data)
     
     def add_payment_request(self, session_id, payment_data):
         """Add payment request to memory."""
-        if session_id not in self.memory:
-            self.memory[session_id] = {
-                "conversation_history": [],
-                "user_preferences": {},
-                "past_searches": [],
-                "payment_requests": [],
-                "created_at": datetime.now().isoformat()
-            }
+        with self._locked_session(session_id) as session_data:
+            session_data["payment_requests"].append(payment_data)
+            self._save_session(session_id, session_data)
+    
+    def update_payment_request(self, session_id, payment_id, updates):
+        """Update a stored payment request in place; returns False if it was not found."""
+        with self._locked_session(session_id, create=False) as session_data:
+            if session_data is None:
+                return False
+            for payment in session_data.get("payment_requests", []):
+                if payment.get("payment_id") == payment_id:
+                    payment.update(updates)
+                    self._save_session(session_id, session_data)
+                    return True
+            return False
+    
+    def sweep(self, policy, archive, limit=200):
+        """Apply a RetentionPolicy to the next `limit` sessions in round-robin order.
         
-        self.memory[session_id]["payment_requests"].append(payment_data)
-        self._save_memory()
+        Locks are taken per session rather than for the whole batch, so
+        requests are never held up for more than one session's worth of work.
+        Sessions trimmed by the per-user cap are deleted one at a time under
+        their own locks, never while another session's lock is held.
+        """
+        counts = {"scanned": 0, "expired_sessions": 0, "trimmed_sessions": 0, "archived_payments": 0}
+        now = datetime.now()
+        with self.lock:
+            if not self._sweep_queue:
+                self._sweep_queue.extend(self.memory.session_ids())
+        for _ in range(limit):
+            with self.lock:
+                if not self._sweep_queue:
+                    break
+                session_id = self._sweep_queue.popleft()
+            trim = []
+            with self.store.session_lock(session_id):
+                with self.lock:
+                    self._refresh()
+                    session_data = self.memory.peek(session_id)
+                    if session_data is None:
+                        continue
+                    counts["scanned"] += 1
+                    
+                    if policy.session_expired(session_last_active(session_data), now):
+                        counts["archived_payments"] += self._delete_session(session_id, archive, "session_expired")
+                        counts["expired_sessions"] += 1
+                        continue
+                
+                payments_list = session_data.get("payment_requests", [])
+                archivable = [payment for payment in payments_list if policy.payment_archivable(payment, now)]
+                if archivable:
+                    counts["archived_payments"] += archive.append(
+                        session_id, self.session_owners.get(session_id), archivable, "payment_aged"
+                    )
+                    with self.lock:
+                        session_data = self.memory[session_id]
+                    session_data["payment_requests"] = [
+                        payment for payment in payments_list if not policy.payment_archivable(payment, now)
+                    ]
+                    self._save_session(session_id, session_data)
+                
+                with self.lock:
+                    user_id = self.session_owners.get(session_id)
+                    sessions = self.user_index.get(user_id, {})
+                    if policy.max_sessions_per_user and len(sessions) > policy.max_sessions_per_user:
+                        active = self.user_sessions.get(user_id)
+                        excess = len(sessions) - policy.max_sessions_per_user
+                        trim = [sid for sid in sessions if sid != active][:excess]
+            for old_session in trim:
+                with self.store.session_lock(old_session):
+                    with self.lock:
+                        if old_session not in self.memory:
+                            continue
+                        counts["archived_payments"] += self._delete_session(old_session, archive, "session_limit")
+                        counts["trimmed_sessions"] += 1
+        return counts
+    
+    def memory_stats(self):
+        """Residency counters and process RSS for the memory metrics endpoint."""
+        with self.lock:
+            return {
+                "backend": type(self.store).__name__,
+                "paging": self.store.supports_paging,
+                "stored_sessions": len(self.memory),
+                "resident_sessions": self.memory.resident_count(),
+                "max_resident_sessions": self.memory.max_resident,
+                "resident_users": len(self.recent_conversations),
+                "active_users": len(self.user_sessions),
+                "indexed_users": len(self.user_index),
+                "cache_hits": self.memory.hits,
+                "cache_misses": self.memory.misses,
+                "evictions": self.memory.evictions,
+                "rss_bytes": process_rss_bytes(),
+            }
+
+def create_conversation_memory():
+    """Build the conversation memory selected by the MEMORY_BACKEND environment variable."""
+    if os.getenv("MEMORY_BACKEND", "journal").lower() == "sqlite":
+        return SqliteConversationMemory(
+            os.getenv("MEMORY_SQLITE_PATH", "conversation_memory.db"),
+            migrate_from="conversation_memory.json",
+        )
+    return ConversationMemory(
+        max_resident_sessions=int(os.getenv("MEMORY_MAX_RESIDENT_SESSIONS", "10000")),
+        max_resident_users=int(os.getenv("MEMORY_MAX_RESIDENT_USERS", "10000")),
+    )
 
 # Global memory instance
-conversation_memory = ConversationMemory()
+conversation_memory = create_conversation_memory()
+
+def duration_env(name):
+    """Read a duration such as "30 days" from the environment; unset means 0 (disabled)."""
+    value = os.getenv(name, "")
+    return payments.parse_duration(value) if value else 0
+
+# Expires idle sessions, caps sessions per user and archives old payment records a batch at a time
+memory_sweeper = MemorySweeper(
+    conversation_memory,
+    RetentionPolicy(
+        session_ttl=duration_env("MEMORY_SESSION_TTL"),
+        max_sessions_per_user=int(os.getenv("MEMORY_MAX_SESSIONS_PER_USER", "0")),
+        payment_archive_after=duration_env("MEMORY_PAYMENT_ARCHIVE_AFTER"),
+    ),
+    PaymentArchive(os.getenv("MEMORY_PAYMENT_ARCHIVE_PATH", "payment_archive.jsonl")),
+    interval=float(os.getenv("MEMORY_SWEEP_INTERVAL_SECONDS", "5")),
+    batch_size=int(os.getenv("MEMORY_SWEEP_BATCH", "200")),
+)
+
+# Global ledger of verified payments, shared by every session and worker
+payment_ledger = PaymentLedger(os.getenv("PAYMENT_LEDGER_PATH", "payment_ledger.db"))
+
+# Current inventory snapshot and its search index, hot-reloaded from INVENTORY_SOURCE
+inventory_store = InventoryStore(
+    create_inventory_provider(os.getenv("INVENTORY_SOURCE", ""), INVENTORY_ITEMS),
+    poll_interval=float(os.getenv("INVENTORY_RELOAD_SECONDS", "5")),
+)
+
+# Stock held for pending orders, released when the payment window runs out
+reservation_engine = ReservationEngine(
+    inventory_store, ttl_seconds=payments.parse_duration(PAYMENT_CONFIG["payment_timeout"])
+)
+
+# (payment_id, session_id) of each hold made while handling the current A2A task, set by the
+# executor so the holds can be given back if the task is cancelled
+task_reservations = contextvars.ContextVar("task_reservations", default=None)
+
+# Tool response text cached per inventory/config version
+response_renderer = ResponseRenderer(PAYMENT_CONFIG, inventory_store, reservation_engine)
+
+def update_payment_config(updates):
+    """Apply changes to PAYMENT_CONFIG and invalidate everything rendered or derived from it."""
+    PAYMENT_CONFIG.update(updates)
+    reservation_engine.ttl_seconds = payments.parse_duration(PAYMENT_CONFIG["payment_timeout"])
+    response_renderer.invalidate_config()
 
 def get_inventory():
     """Return the current inventory items."""
-    return INVENTORY_ITEMS
+    return inventory_store.items()
 
-def check_inventory(user_id: str, session_id: str):
-    """Get current inventory with all items, prices, and stock levels."""
+async def check_inventory(user_id: str, session_id: str, category: str = "", min_price: float = 0.0, max_price: float = 0.0,
+                          in_stock_only: bool = False, sort: str = "id", fields: str = "", limit: int = 50, cursor: str = ""):
+    """Get current inventory with items, prices, and stock levels, one page at a time.
+
+    Optional filters: category, min_price/max_price (0 means no bound) and
+    in_stock_only. sort is one of id, name, price_asc, price_desc, stock_desc.
+    limit caps the items returned (at most 100); pass next_cursor from a previous
+    page as cursor to continue. fields is a comma-separated subset of
+    id,name,category,price,stock to include in JSON output.
+    """
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
-    
-    items = get_inventory()
-    inventory_text = "📦 **Current Inventory:**\n\n"
-    for item in items:
-        inventory_text += f"• **{item['name']}** - ${item['price']:.2f} (Stock: {item['stock']})\n"
-    
-    # Update memory with this interaction
-    conversation_memory.update_session_memory(
-        actual_session_id, 
-        "check_inventory", 
-        inventory_text,
-        {"action": "inventory_check", "items_count": len(items)}
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
+    
+    snapshot = inventory_store.snapshot
+    limit = tool_results.clamp_limit(limit)
+    filtered = bool(category or min_price or max_price or in_stock_only)
+    if category and category.lower() not in snapshot.categories():
+        return f"❌ Unknown category '{category}'. Available: {', '.join(snapshot.categories())}"
+    try:
+        selected_fields = tool_results.parse_fields(fields)
+        after = tool_results.decode_key_cursor(cursor, sort)
+        items, next_key, total = snapshot.query(
+            sort=sort,
+            category=category or None,
+            min_price=min_price or None,
+            max_price=max_price or None,
+            after=after,
+            limit=limit,
+            predicate=(lambda item: reservation_engine.available(item["id"]) > 0) if in_stock_only else None,
+        )
+    except ValueError as e:
+        return f"❌ {e}"
+    next_cursor = tool_results.encode_key_cursor(sort, next_key) if next_key else None
+    
+    if TOOL_OUTPUT_FORMAT == "json":
+        result = tool_results.build_page(items, reservation_engine.available, selected_fields, total, next_cursor)
+        inventory_text = tool_results.to_json(result)
+    elif sort == "id" and not (filtered or after or next_cursor):
+        result = inventory_text = response_renderer.inventory()
+    else:
+        page = tool_results.build_page(items, reservation_engine.available, total=total, next_cursor=next_cursor)
+        result = inventory_text = response_renderer.inventory_page(page)
+    
+    # Record the call; identical listings share one stored copy
+    await asyncio.to_thread(
+        conversation_memory.record_tool_call,
+        actual_session_id,
+        "check_inventory",
+        {"category": category, "min_price": min_price, "max_price": max_price, "in_stock_only": in_stock_only,
+         "sort": sort, "fields": fields, "limit": limit, "cursor": cursor},
+        inventory_text
     )
     
-    return inventory_text
+    return result
+
+async def search_product(product_name: str, user_id: str, session_id: str, limit: int = 10, cursor: str = "", fields: str = ""):
+    """Search for products in inventory by name, tolerating plurals and typos; returns the best matches first.
 
-def search_product(product_name: str, user_id: str, session_id: str):
-    """Search for a specific product in inventory by name."""
+    limit caps the results (at most 100); pass next_cursor from a previous call as
+    cursor for more. fields selects item fields for JSON output, as in check_inventory.
+    """
 
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
-    items = get_inventory()
-    results = [item for item in items if product_name.lower() in item['name'].lower()]
+    try:
+        selected_fields = tool_results.parse_fields(fields)
+        offset, limit = tool_results.page_bounds(cursor, limit)
+    except ValueError as e:
+        return f"❌ {e}"
+    
+    # Rank one extra result to know whether another page exists
+    ranked = inventory_store.snapshot.catalog.search(product_name, limit=offset + limit + 1)
+    if TOOL_OUTPUT_FORMAT != "json":
+        selected_fields = tool_results.ITEM_FIELDS  # Markdown lines always show every field
+    page = tool_results.item_page(
+        ranked, reservation_engine.available, selected_fields, cursor, limit, known_total=False
+    )
+    results = tool_results.page_items(page)
     
-    if not results:
-        result_text = f"❌ No products found matching '{product_name}'"
+    if TOOL_OUTPUT_FORMAT == "json":
+        result = page
+        result_text = tool_results.to_json(page)
+    elif not results:
+        result = result_text = f"❌ No products found matching '{product_name}'"
     else:
-        result_text = f"🔍 **Found {len(results)} product(s) matching '{product_name}':**\n\n"
-        for item in results:
-            result_text += f"• **{item['name']}** - ${item['price']:.2f} (Stock: {item['stock']})\n"
+        lines = [f"🔍 **Found {len(results)} product(s) matching '{product_name}':**\n\n"]
+        lines.extend(
+            f"• **{item['name']}** (ID: {item['id']}) - ${item['price']:.2f} (Stock: {item['stock']})\n"
+            for item in results
+        )
+        if page["next_cursor"]:
+            lines.append(f"\nMore matches available - next page cursor: `{page['next_cursor']}`\n")
+        result = result_text = "".join(lines)
     
     # Add to search history
-    conversation_memory.add_search_history(actual_session_id, product_name, len(results))
+    await asyncio.to_thread(conversation_memory.add_search_history, actual_session_id, product_name, len(results))
     
-    # Update memory with this interaction
-    conversation_memory.update_session_memory(
+    # Record the call; identical results share one stored copy
+    await asyncio.to_thread(
+        conversation_memory.record_tool_call,
         actual_session_id,
-        f"search_product: {product_name}",
-        result_text,
-        {"action": "product_search", "search_term": product_name, "results_found": len(results)}
+        "search_product",
+        {"product_name": product_name, "limit": limit, "cursor": cursor, "fields": fields},
+        result_text
     )
     
-    return result_text
+    return result
+
+async def get_payment_info(network: str, user_id: str, session_id: str, expected_amount: float = 0.0, payer_address: str = "",
+                           product_id: int = 0, quantity: int = 1):
+    """Get blockchain wallet address and payment information for USDC payments.
 
-def get_payment_info(network: str, user_id: str, session_id: str):
-    """Get blockchain wallet address and payment information for USDC payments."""
+    When the order total (expected_amount) is known, a pending payment request is
+    registered so the transfer is detected on-chain automatically; payer_address
+    is the buyer's sending wallet, if they shared it. Passing product_id and
+    quantity reserves that stock until the payment window closes and sets the
+    amount due to price * quantity.
+    """
 
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
     # Validate network
     if network.lower() not in PAYMENT_CONFIG["supported_networks"]:
@@ -280,81 +701,112 @@ def get_payment_info(network: str, user_id: str, session_id: str):
     
     network_info = PAYMENT_CONFIG["supported_networks"][network.lower()]
     
-    payment_text = f"💳 **Payment Information - {network_info['name']}**\n\n"
-    payment_text += f"**💰 Accepted Currency:** USDC only\n"
-    payment_text += f"**🔗 Network:** {network_info['name']} (Chain ID: {network_info['chain_id']})\n"
-    payment_text += f"**📍 Wallet Address:** `{network_info['wallet_address']}`\n"
-    payment_text += f"**📄 USDC Contract:** `{network_info['usdc_contract']}`\n\n"
-    
-    payment_text += f"**📊 Network Details:**\n"
-    payment_text += f"• Network Fee: {network_info['network_fee']}\n"
-    payment_text += f"• Confirmation Time: {network_info['confirmation_time']}\n"
-    payment_text += f"• Minimum Payment: ${PAYMENT_CONFIG['minimum_payment']:.2f} USDC\n"
-    payment_text += f"• Payment Timeout: {PAYMENT_CONFIG['payment_timeout']}\n\n"
-    
-    payment_text += f"**⚠️ Important:**\n"
-    payment_text += f"• Only send USDC tokens to this address\n"
-    payment_text += f"• Ensure you're on the correct network ({network_info['name']})\n"
-    payment_text += f"• Include your order reference in the transaction memo if possible\n"
-    payment_text += f"• Double-check the wallet address before sending\n"
+    # Hold the stock before quoting, so two buyers cannot pay for the last unit
+    payment_id = uuid.uuid4().hex[:12]
+    reservation = None
+    if product_id:
+        try:
+            reservation = reservation_engine.reserve(payment_id, product_id, quantity, owner=actual_session_id)
+        except ReservationError as e:
+            return f"❌ **Cannot reserve item** - {e}"
+        held = task_reservations.get()
+        if held is not None:
+            held.append((payment_id, actual_session_id))
+        expected_amount = round(reservation["unit_price"] * quantity, 2)
     
     # Store payment request in memory
+    created_at = datetime.now()
     payment_data = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": created_at.isoformat(),
         "network": network_info['name'],
+        "network_key": network.lower(),
         "wallet_address": network_info['wallet_address'],
         "user_id": user_id,
         "session_id": actual_session_id
     }
-    conversation_memory.add_payment_request(actual_session_id, payment_data)
     
-    # Update memory with this interaction
-    conversation_memory.update_session_memory(
+    # Register the request with the on-chain watcher when the amount due is known
+    if expected_amount > 0:
+        expires_at = created_at + timedelta(seconds=payments.parse_duration(PAYMENT_CONFIG["payment_timeout"]))
+        await asyncio.to_thread(
+            payment_ledger.add_payment_request,
+            payment_id, network, user_id, actual_session_id, expected_amount, payer_address, created_at, expires_at
+        )
+        payment_data.update({
+            "payment_id": payment_id,
+            "expected_amount": expected_amount,
+            "payer_address": payer_address or None,
+            "expires_at": expires_at.isoformat(),
+            "status": "pending"
+        })
+        if reservation:
+            payment_data.update({"product_id": product_id, "quantity": quantity, "reservation": "held"})
+    
+    if TOOL_OUTPUT_FORMAT == "json":
+        result = response_renderer.payment_info_data(network.lower())
+        if "payment_id" in payment_data:
+            result.update({"payment_id": payment_id, "amount_due": expected_amount, "expires_at": payment_data["expires_at"]})
+            if reservation:
+                result["reserved"] = {"product_id": product_id, "quantity": quantity}
+        payment_text = tool_results.to_json(result)
+    else:
+        payment_text = response_renderer.payment_info(network.lower())
+        if "payment_id" in payment_data:
+            order_lines = [f"\n**🧾 Order Reference:** `{payment_id}`\n"]
+            if reservation:
+                item = inventory_store.get(product_id)
+                order_lines.append(f"• Reserved: {quantity} x {item['name'] if item else product_id} until {expires_at.strftime('%H:%M')}\n")
+            order_lines.append(f"• Amount Due: ${expected_amount:.2f} USDC\n")
+            order_lines.append("• Your payment will be detected automatically once it is confirmed on-chain\n")
+            payment_text = payment_text + "".join(order_lines)
+        result = payment_text
+    
+    await asyncio.to_thread(conversation_memory.add_payment_request, actual_session_id, payment_data)
+    
+    # Record the call; the payment request itself is stored above
+    await asyncio.to_thread(
+        conversation_memory.record_tool_call,
         actual_session_id,
-        f"get_payment_info: {network}",
-        payment_text,
-        {"action": "payment_info_request", "network": network, "wallet_provided": True}
+        "get_payment_info",
+        {"network": network, "expected_amount": expected_amount, "product_id": product_id, "quantity": quantity},
+        payment_text
     )
     
-    return payment_text
+    return result
 
-def get_supported_networks(user_id: str, session_id: str):
+async def get_supported_networks(user_id: str, session_id: str):
     """Get list of all supported blockchain networks for payments."""
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
-    
-    networks_text = "🌐 **Supported Payment Networks:**\n\n"
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
-    for network_key, network_info in PAYMENT_CONFIG["supported_networks"].items():
-        networks_text += f"**{network_info['name']}** ({network_key})\n"
-        networks_text += f"• Chain ID: {network_info['chain_id']}\n"
-        networks_text += f"• Network Fee: {network_info['network_fee']}\n"
-        networks_text += f"• Confirmation Time: {network_info['confirmation_time']}\n\n"
-    
-    networks_text += f"**💡 Recommended:** {PAYMENT_CONFIG['supported_networks'][PAYMENT_CONFIG['default_network']]['name']} "
-    networks_text += f"(Low fees, fast confirmations)\n\n"
-    networks_text += f"**📝 To get payment address:** Ask for 'payment info' and specify the network\n"
-    networks_text += f"Example: 'I want to pay with USDC on Polygon'\n"
+    if TOOL_OUTPUT_FORMAT == "json":
+        result = response_renderer.supported_networks_data()
+        networks_text = tool_results.to_json(result)
+    else:
+        result = networks_text = response_renderer.supported_networks()
     
-    # Update memory with this interaction
-    conversation_memory.update_session_memory(
+    # Record the call
+    await asyncio.to_thread(
+        conversation_memory.record_tool_call,
         actual_session_id,
         "get_supported_networks",
-        networks_text,
-        {"action": "networks_info_request"}
+        {},
+        networks_text
     )
     
-    return networks_text
+    return result
 
-def get_conversation_context(user_id: str, session_id: str):
+async def get_conversation_context(user_id: str, session_id: str):
     """Get conversation context and history for the user across sessions."""
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
-    current_session_memory = conversation_memory.get_session_memory(actual_session_id)
-    user_history = conversation_memory.get_user_conversation_history(user_id)
+    current_session_memory = await asyncio.to_thread(conversation_memory.get_session_memory, actual_session_id)
+    user_history = await asyncio.to_thread(conversation_memory.get_user_conversation_history, user_id)
     
-    if not user_history and not current_session_memory["conversation_history"]:
+    # A session with saved preferences, payments or searches is not new even before its first chat turn
+    session_sections = ("conversation_history", "user_preferences", "payment_requests", "past_searches")
+    if not user_history and not any(current_session_memory[section] for section in session_sections):
         return "🆕 **New conversation started.** How can I help you today?"
     
     context_text = "💭 **Your Conversation Context:**\n\n"
@@ -389,71 +841,63 @@ def get_conversation_context(user_id: str, session_id: str):
     
     return context_text
 
-def save_user_preference(preference_key: str, preference_value: str, user_id: str, session_id: str):
+async def save_user_preference(preference_key: str, preference_value: str, user_id: str, session_id: str):
     """Save a user preference for future reference."""
     # Get proper session for user
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
-    conversation_memory.add_user_preference(actual_session_id, preference_key, preference_value)
+    await asyncio.to_thread(conversation_memory.add_user_preference, actual_session_id, preference_key, preference_value)
     return f"✅ **Preference saved:** {preference_key} = {preference_value} (Session: {actual_session_id})"
 
-def start_new_session(user_id: str):
+async def start_new_session(user_id: str):
     """Start a new conversation session for the user."""
     # Generate new session ID
     new_session_id = f"{user_id}_{int(datetime.now().timestamp())}"
-    conversation_memory.user_sessions[user_id] = new_session_id
+    await asyncio.to_thread(conversation_memory.set_active_session, user_id, new_session_id)
     
     return f"🆕 **New session started!** Session ID: {new_session_id}\nYour previous conversations are still accessible for context."
 
 
-def verify_usdc_payment(tx_hash: str, expected_amount: float, network: str, user_id: str, session_id: str):
-    """Verify USDC payment transaction on blockchain."""
-    actual_session_id = conversation_memory.get_or_create_session_for_user(user_id, session_id)
+async def verify_usdc_payment(tx_hash: str, expected_amount: float, network: str, user_id: str, session_id: str,
+                              payment_id: str = ""):
+    """Verify USDC payment transaction on blockchain.
+
+    payment_id is the order reference the payment is for, if the customer
+    gave it; otherwise the order is the only pending one for expected_amount.
+    """
+    actual_session_id = await asyncio.to_thread(conversation_memory.get_or_create_session_for_user, user_id, session_id)
     
     try:
         network_info = PAYMENT_CONFIG["supported_networks"][network.lower()]
-        retailer_address = network_info["wallet_address"].lower()
-        usdc_contract = network_info["usdc_contract"].lower()
         
-        # Use public RPC endpoints
-        rpc_urls = {
-            "ethereum": "https://eth.llamarpc.com",
-            "polygon": "https://polygon-rpc.com",
-            "arbitrum": "https://arb1.arbitrum.io/rpc"
-        }
+        # Answered from the ledger when this hash was checked before, otherwise
+        # one batched receipt lookup; the transaction body is not needed
+        result = (await payments.verify_usdc_payments(
+            [tx_hash], network.lower(), network_info, [expected_amount], ledger=payment_ledger
+        ))[0]
+        amount_received = result["amount_usdc"]
         
-        w3 = Web3(Web3.HTTPProvider(rpc_urls[network.lower()]))
+        if result["status"] == "error":
+            return f"❌ **Verification failed** - Error: {result['error']}"
         
-        # Get transaction receipt
-        tx_receipt = w3.eth.get_transaction_receipt(tx_hash)
-        tx = w3.eth.get_transaction(tx_hash)
+        if result["status"] == "not_found":
+            return f"❌ **Transaction not found** - Hash: {tx_hash} may still be pending"
         
         # Check if transaction was successful
-        if tx_receipt.status != 1:
+        if result["status"] == "failed":
             return f"❌ **Transaction failed** - Hash: {tx_hash}"
         
-        # Verify it's a USDC transfer to our address
-        payment_verified = False
-        amount_received = 0
-        
-        for log in tx_receipt.logs:
-            print(f"Log: {log}")
-            if log.address.lower() == usdc_contract:
-                # Decode Transfer event (to our address)
-                if len(log.topics) >= 3:
-                    to_address = "0x" + log.topics[2].hex()[-40:]
-                    if to_address.lower() == retailer_address:
-                        # USDC has 6 decimals
-                        amount_received = int(log.data, 16) / 1000000
-                        payment_verified = True
-                        break
-        
-        if not payment_verified:
+        if result["status"] == "no_payment":
             return f"❌ **Payment not found** - No USDC transfer to our address in transaction {tx_hash}"
         
-        if amount_received < expected_amount:
+        if result["status"] == "insufficient":
             return f"❌ **Insufficient payment** - Expected: ${expected_amount:.2f} USDC, Received: ${amount_received:.2f} USDC"
         
+        # A hash can only pay for one order: the first session to verify it owns it
+        already_recorded = result.get("claimed_session_id") == actual_session_id and result.get("claimed_user_id") == user_id
+        if not await asyncio.to_thread(payment_ledger.claim, network, tx_hash, user_id, actual_session_id):
+            return f"❌ **Payment already used** - Transaction {tx_hash} has already been applied to another order"
+        
         # Store successful payment
         payment_data = {
             "timestamp": datetime.now().isoformat(),
@@ -464,7 +908,30 @@ def verify_usdc_payment(tx_hash: str, expected_amount: float, network: str, user
             "status": "verified",
             "user_id": user_id
         }
-        conversation_memory.add_payment_request(actual_session_id, payment_data)
+        if not already_recorded:
+            await asyncio.to_thread(conversation_memory.add_payment_request, actual_session_id, payment_data)
+            # Settle the order this payment is for, if it can be told apart from the session's other orders
+            request = match_session_request(
+                await asyncio.to_thread(payment_ledger.pending_requests, network, actual_session_id),
+                expected_amount, amount_received, payment_id,
+            )
+            if request and await asyncio.to_thread(payment_ledger.mark_request_paid, request["payment_id"], tx_hash):
+                settled_payment_id = request["payment_id"]
+                updates = {"status": "verified", "tx_hash": tx_hash, "amount_usdc": amount_received}
+                reservation_status = await asyncio.to_thread(
+                    settle_reservation, settled_payment_id, actual_session_id, network, tx_hash
+                )
+                if reservation_status:
+                    updates["reservation"] = reservation_status
+                await asyncio.to_thread(
+                    conversation_memory.update_payment_request,
+                    actual_session_id,
+                    settled_payment_id,
+                    updates
+                )
+                if reservation_status == "unavailable":
+                    return (f"⚠️ **Payment Verified, item no longer available** - Transaction {tx_hash} was received "
+                            f"after the reservation expired and the stock has since sold out. Please contact support for a refund.")
         
         result_text = f"✅ **Payment Verified!**\n\n"
         result_text += f"• Transaction: {tx_hash}\n"
@@ -478,6 +945,87 @@ def verify_usdc_payment(tx_hash: str, expected_amount: float, network: str, user
     except Exception as e:
         return f"❌ **Verification failed** - Error: {str(e)}"
 
+async def verify_usdc_payments(tx_hashes, network, expected_amounts=None):
+    """Verify many USDC payments on one network in batched RPC round-trips (for reconciliation jobs)."""
+    network_info = PAYMENT_CONFIG["supported_networks"][network.lower()]
+    return await payments.verify_usdc_payments(
+        tx_hashes, network.lower(), network_info, expected_amounts, ledger=payment_ledger
+    )
+
+def match_session_request(pending, expected_amount, amount_received, payment_id=""):
+    """The one pending request of a session a verified payment settles, or None if there is no single match."""
+    if payment_id:
+        candidates = [r for r in pending if r["payment_id"] == payment_id]
+    else:
+        candidates = [r for r in pending if abs(r["expected_amount"] - expected_amount) <= AMOUNT_TOLERANCE_USDC]
+    if len(candidates) != 1 or candidates[0]["expected_amount"] - amount_received > AMOUNT_TOLERANCE_USDC:
+        return None
+    return candidates[0]
+
+def settle_reservation(payment_id, session_id, network, tx_hash):
+    """Commit the stock held for a paid order; returns "committed", "unavailable" or None if nothing was reserved.
+
+    Only the order the ledger recorded as paid by tx_hash is committed, so a
+    payment can never turn another order's hold into a sale. A hold the
+    engine no longer knows, forgotten after its TTL or lost in a restart,
+    is taken again from the order stored with the payment request, so a
+    late payment is only confirmed while the stock is still there.
+    """
+    if payment_ledger.request_paid_by(network, tx_hash) != payment_id:
+        return None
+    reservation = reservation_engine.get(payment_id)
+    if reservation is not None and reservation["owner"] not in (None, session_id):
+        return None
+    if reservation is None:
+        order = next(
+            (request for request in conversation_memory.get_session_memory(session_id)["payment_requests"]
+             if request.get("payment_id") == payment_id),
+            None,
+        )
+        if not order or not order.get("product_id"):
+            return None
+        if order.get("reservation") == "released":
+            return "unavailable"  # Cancelled before the hold was forgotten
+        try:
+            reservation_engine.reserve(payment_id, order["product_id"], order.get("quantity", 1), owner=session_id)
+        except ReservationError:
+            return "unavailable"
+    return "committed" if reservation_engine.commit(payment_id) else "unavailable"
+
+def release_task_reservations(reservations):
+    """Give back the stock still held by a cancelled task's orders; returns how many holds were released.
+
+    Their payment requests are cancelled too, so the watcher stops matching transfers against them.
+    """
+    released = 0
+    for payment_id, session_id in reservations:
+        if reservation_engine.release(payment_id):
+            payment_ledger.cancel_request(payment_id)
+            conversation_memory.update_payment_request(session_id, payment_id, {"reservation": "released"})
+            released += 1
+    return released
+
+async def record_watched_payment(request, transfer):
+    """Mark a pending payment request verified after the payment watcher matched an on-chain transfer."""
+    updates = {
+        "status": "verified",
+        "tx_hash": transfer["tx_hash"],
+        "amount_usdc": transfer["amount_usdc"],
+        "payer_address": transfer["payer_address"],
+        "verified_at": datetime.now().isoformat()
+    }
+    reservation_status = await asyncio.to_thread(
+        settle_reservation, request["payment_id"], request["session_id"], request["network"], transfer["tx_hash"]
+    )
+    if reservation_status:
+        updates["reservation"] = reservation_status
+    await asyncio.to_thread(
+        conversation_memory.update_payment_request,
+        request["session_id"],
+        request["payment_id"],
+        updates
+    )
+
 verify_payment_tool = FunctionTool(func=verify_usdc_payment)
 
 # Add to tool_List
@@ -500,11 +1048,15 @@ instruction=(
     "You are a Retailer Agent for an electronics retail store with persistent conversation memory and USDC payment capabilities. "
     "You can remember conversations across multiple sessions for each user.\n\n"
     "Use the available tools to help customers:\n"
-    "- Use 'check_inventory' to show all available products\n"
+    "- Use 'check_inventory' to show available products; filter by category, price range or in-stock only, "
+    "sort by name or price, and page through large catalogs with the returned next_cursor\n"
     "- Use 'search_product' to find specific items\n"
-    "- Use 'get_payment_info' to provide blockchain wallet address for USDC payments (specify network: ethereum, polygon, or arbitrum)\n"
+    "- Use 'get_payment_info' to provide blockchain wallet address for USDC payments (specify network: ethereum, polygon, or arbitrum; "
+    "pass the order total as expected_amount when known so the payment is detected automatically; when the customer is buying a "
+    "specific product, pass its product_id and quantity instead so the stock is reserved and the total is computed)\n"
     "- Use 'get_supported_networks' to show all available payment networks\n"
-    "- Use 'verify_usdc_payment' to verify blockchain payment transactions (requires tx_hash, expected_amount, and network)\n"
+    "- Use 'verify_usdc_payment' to verify blockchain payment transactions (requires tx_hash, expected_amount, and network; "
+    "pass the order reference as payment_id when the customer gives it)\n"
     "- Use 'get_conversation_context' to recall previous conversations and user preferences across sessions\n"
     "- Use 'save_user_preference' to remember customer preferences for future interactions\n"
     "- Use 'start_new_session' to begin a fresh conversation while keeping access to history\n\n"
@@ -512,9 +1064,15 @@ instruction=(
     "When customers ask about payment, always use the payment tools to provide accurate wallet addresses and network information. "
     "Recommend Polygon network for lower fees and faster confirmations unless customer specifies otherwise. "
     "When customers provide transaction hash for payment verification, use 'verify_usdc_payment' to confirm the payment.\n\n"
+    + (
+        "TOOL RESULTS: Inventory, search, network and payment tools return compact JSON. Present the results to the "
+        "customer as a short, readable list in your reply; use next_cursor to fetch further pages only when needed.\n\n"
+        if TOOL_OUTPUT_FORMAT == "json" else ""
+    ) +
     "IMPORTANT: Always extract the user_id from the query context (look for Session ID or user info) "
     "and pass it to tool functions to maintain conversation continuity.\n\n"
-    "Always start by checking conversation context to provide personalized service. "
+    "Earlier turns of the current conversation are already in your context; call 'get_conversation_context' "
+    "at the start of a new conversation, or to recall other sessions, to provide personalized service. "
     "Remember user preferences like favorite product categories, budget ranges, payment network preferences, or specific needs. "
     "Reference previous searches and conversations to provide better recommendations. "
     "Acknowledge when you remember previous interactions to show continuity."
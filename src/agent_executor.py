@@ -1,18 +1,28 @@
+import asyncio
+import uuid
+
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
+    Artifact,
     Part,
+    TaskArtifactUpdateEvent,
     TaskState,
     TextPart,
 )
 from a2a.utils import new_agent_text_message, new_task
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.artifacts import InMemoryArtifactService
+from google.adk.events import Event
 from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
-from agent import conversation_memory
+from adk_sessions import create_session_service
+from agent import conversation_memory, release_task_reservations, task_reservations
+
+# How long cancel() waits for a cancelled run to unwind before reporting the task canceled
+CANCEL_GRACE_SECONDS = 5
 
 
 class RetailerAgentExecutor(AgentExecutor):
@@ -21,6 +31,10 @@ class RetailerAgentExecutor(AgentExecutor):
         agent,
         status_message="Processing request...",
         artifact_name="response",
+        session_service=None,
+        streaming=True,
+        intent_router=None,
+        response_cache=None,
     ):
         """Initialize a generic ADK agent executor.
 
@@ -28,6 +42,10 @@ class RetailerAgentExecutor(AgentExecutor):
             agent: The ADK agent instance
             status_message: Message to display while processing
             artifact_name: Name for the response artifact
+            session_service: ADK session service; defaults to a persistent one backed by the memory store
+            streaming: Forward model output to the client as it is generated
+            intent_router: Answers canned requests from the tools without the model; None sends everything to the model
+            response_cache: Serves earlier model replies to repeated opening questions; None disables caching
         """
         self.agent = agent
         self.status_message = status_message
@@ -36,18 +54,105 @@ class RetailerAgentExecutor(AgentExecutor):
             app_name=agent.name,
             agent=agent,
             artifact_service=InMemoryArtifactService(),
-            session_service=InMemorySessionService(),
+            session_service=session_service or create_session_service(),
             memory_service=InMemoryMemoryService(),
         )
+        self.run_config = RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE)
+        self.intent_router = intent_router
+        self.response_cache = response_cache
+        self._running = {}  # A2A task id -> (asyncio task executing it, event set when execute() ends)
+
+    async def _get_or_create_session(self, user_id, session_id):
+        """Reuse the ADK session for this conversation, so earlier turns stay in the model's context."""
+        session_service = self.runner.session_service
+        session = await session_service.get_session(
+            app_name=self.agent.name, user_id=user_id, session_id=session_id
+        )
+        if session is None:
+            session = await session_service.create_session(
+                app_name=self.agent.name, user_id=user_id, state={}, session_id=session_id
+            )
+        return session
+
+    async def _append_turn(self, session, content, response_text):
+        """Add a turn answered without the model to its ADK session, so later turns still see it."""
+        invocation_id = f"e-{uuid.uuid4()}"
+        session_service = self.runner.session_service
+        await session_service.append_event(
+            session, Event(invocation_id=invocation_id, author="user", content=content)
+        )
+        reply = types.Content(role="model", parts=[types.Part.from_text(text=response_text)])
+        await session_service.append_event(
+            session, Event(invocation_id=invocation_id, author=self.agent.name, content=reply)
+        )
+
+    async def _send_artifact(self, updater, artifact_id, text, append, last_chunk):
+        """Send one piece of the response artifact to the client."""
+        # TaskUpdater.add_artifact in a2a-sdk 0.2.9 cannot set append/lastChunk, so the event is built here
+        await updater.event_queue.enqueue_event(
+            TaskArtifactUpdateEvent(
+                taskId=updater.task_id,
+                contextId=updater.context_id,
+                artifact=Artifact(
+                    artifactId=artifact_id,
+                    name=self.artifact_name,
+                    parts=[Part(root=TextPart(text=text))],
+                ),
+                append=append,
+                lastChunk=last_chunk,
+            )
+        )
+
+    async def _run_agent(self, updater, artifact_id, session, content):
+        """Run the model on one message; returns the final reply text and the names of the tools it called."""
+        # Partial model output is sent as chunks of one artifact while it is generated
+        streamed = False
+        response_text = ""
+        tools_used = set()
+        async for event in self.runner.run_async(
+            user_id=session.user_id, session_id=session.id, new_message=content, run_config=self.run_config
+        ):
+            tools_used.update(call.name for call in event.get_function_calls())
+            parts = event.content.parts if event.content and event.content.parts else []
+            chunk = "".join(part.text for part in parts if getattr(part, "text", None))
+            if event.partial:
+                if chunk:
+                    await self._send_artifact(updater, artifact_id, chunk, append=streamed, last_chunk=False)
+                    streamed = True
+            elif event.is_final_response():
+                for part in parts:
+                    if hasattr(part, "text") and part.text:
+                        response_text += part.text + "\n"
+                    elif hasattr(part, "function_call"):
+                        # Log or handle function calls if needed
+                        pass  # Function calls are handled internally by ADK
+        return response_text, tools_used
 
     async def cancel(
         self,
         context: RequestContext,
         event_queue: EventQueue,
     ) -> None:
-        """Cancel the execution of a specific task."""
-        raise NotImplementedError(
-            "Cancellation is not implemented for ADKAgentExecutor."
+        """Cancel a running task: stop its agent run, give back what it reserved and report it canceled."""
+        run, finished = self._running.get(context.task_id, (None, None))
+        if run is not None and run is not asyncio.current_task():
+            # The run unwinds from whatever it awaits (model call, RPC request, tool), releases
+            # its reservations and reports the task canceled on its own queue in execute().
+            # Wait for execute() itself: the task running it goes on to close the queue, which
+            # blocks until the caller drains the queue this method was given
+            run.cancel()
+            try:
+                await asyncio.wait_for(finished.wait(), CANCEL_GRACE_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+        # Nothing running here to report it (another worker's task, or one that will not stop)
+        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
+        await updater.update_status(
+            TaskState.canceled,
+            new_agent_text_message("Request canceled.", context.context_id, context.task_id),
+            final=True,
         )
 
     async def execute(
@@ -60,13 +165,22 @@ class RetailerAgentExecutor(AgentExecutor):
         await event_queue.enqueue_event(task)
 
         updater = TaskUpdater(event_queue, task.id, task.contextId)
-        if context.call_context:
+        # Unauthenticated callers all have an empty user name, so each of their conversations gets its own id
+        if context.call_context and context.call_context.user.user_name:
             user_id = context.call_context.user.user_name
         else:
-            user_id = "a2a_user"
+            user_id = f"a2a_user_{task.contextId}"
 
         # Get or create persistent session for this user
-        session_id = conversation_memory.get_or_create_session_for_user(user_id, task.contextId)
+        session_id = await asyncio.to_thread(
+            conversation_memory.get_or_create_session_for_user, user_id, task.contextId
+        )
+
+        # Track the run and the stock it reserves, so cancel() can stop it and give the stock back
+        finished = asyncio.Event()
+        self._running[task.id] = (asyncio.current_task(), finished)
+        reservations = []
+        reservations_token = task_reservations.set(reservations)
 
         try:
             # Update status with custom message
@@ -75,13 +189,8 @@ class RetailerAgentExecutor(AgentExecutor):
                 new_agent_text_message(self.status_message, task.contextId, task.id),
             )
 
-            # Process with ADK agent
-            session = await self.runner.session_service.create_session(
-                app_name=self.agent.name,
-                user_id=user_id,
-                state={},
-                session_id=session_id,
-            )
+            # Process with ADK agent; the model's history belongs to this A2A conversation only
+            session = await self._get_or_create_session(user_id, task.contextId)
 
             # Enhance the query with user and session context for memory-aware processing
             enhanced_query = f"[User ID: {user_id}] [Session ID: {session_id}] [Context ID: {task.contextId}] {query}"
@@ -90,39 +199,69 @@ class RetailerAgentExecutor(AgentExecutor):
                 role="user", parts=[types.Part.from_text(text=enhanced_query)]
             )
 
-            response_text = ""
-            async for event in self.runner.run_async(
-                user_id=user_id, session_id=session.id, new_message=content
-            ):
-                if event.is_final_response() and event.content and event.content.parts:
-                    for part in event.content.parts:
-                        if hasattr(part, "text") and part.text:
-                            response_text += part.text + "\n"
-                        elif hasattr(part, "function_call"):
-                            # Log or handle function calls if needed
-                            pass  # Function calls are handled internally by ADK
+            artifact_id = str(uuid.uuid4())
+            metadata = {"user_id": user_id, "task_id": task.id, "context_id": task.contextId}
+
+            # Canned requests are answered straight from the tools, skipping the model
+            routed = await self.intent_router.answer(query, user_id, session_id) if self.intent_router else None
+            cached = cache_versions = None
+            if routed is None and self.response_cache:
+                cached, cache_versions = self.response_cache.get(query, user_id, new_conversation=not session.events)
+
+            if routed is not None:
+                metadata["intent"], response_text = routed
+                await self._append_turn(session, content, response_text)
+            elif cached is not None:
+                metadata["cached"] = True
+                response_text = cached
+                await self._append_turn(session, content, response_text)
+            else:
+                response_text, tools_used = await self._run_agent(updater, artifact_id, session, content)
+                if self.response_cache:
+                    self.response_cache.put(
+                        query, user_id, cache_versions, tools_used, response_text,
+                        private_values=(user_id, session_id, task.contextId),
+                    )
 
             # Update conversation memory with this interaction using persistent session
-            conversation_memory.update_session_memory(
+            await asyncio.to_thread(
+                conversation_memory.update_session_memory,
                 session_id,
                 query,
                 response_text,
-                {"user_id": user_id, "task_id": task.id, "context_id": task.contextId}
+                metadata
             )
 
-            # Add response as artifact with custom name
-            await updater.add_artifact(
-                [Part(root=TextPart(text=response_text))],
-                name=self.artifact_name,
-            )
+            # Close the artifact by replacing any chunks with the final response, so
+            # clients that read the finished task get it as a single part
+            await self._send_artifact(updater, artifact_id, response_text, append=False, last_chunk=True)
 
             await updater.complete()
 
+        except asyncio.CancelledError:
+            released = await asyncio.to_thread(release_task_reservations, reservations)
+            await asyncio.to_thread(
+                conversation_memory.update_session_memory,
+                session_id,
+                query,
+                "Request canceled.",
+                {"canceled": True, "released_reservations": released,
+                 "user_id": user_id, "task_id": task.id, "context_id": task.contextId}
+            )
+            # Report it on this task's own queue, which the client's stream reads, and end normally:
+            # a2a-sdk 0.2.9 only closes the queue when execute() returns
+            await updater.update_status(
+                TaskState.canceled,
+                new_agent_text_message("Request canceled.", task.contextId, task.id),
+                final=True,
+            )
+
         except Exception as e:
             error_message = f"Error: {e!s}"
             
             # Also save error to memory for context
-            conversation_memory.update_session_memory(
+            await asyncio.to_thread(
+                conversation_memory.update_session_memory,
                 session_id,
                 query,
                 error_message,
@@ -133,4 +272,9 @@ class RetailerAgentExecutor(AgentExecutor):
                 TaskState.failed,
                 new_agent_text_message(error_message, task.contextId, task.id),
                 final=True,
-            )
\ No newline at end of file
+            )
+
+        finally:
+            self._running.pop(task.id, None)
+            finished.set()
+            task_reservations.reset(reservations_token)
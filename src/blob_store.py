@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import os
+import threading
+import zlib
+
+
+# Text shorter than this is stored as-is; compression and indirection cost more than they save
+MIN_COMPRESSED_CHARS = 512
+
+
+def compress_text(text):
+    """zlib-compress text into an ASCII string that can sit inside a JSON session record."""
+    return base64.b64encode(zlib.compress(text.encode(), 6)).decode()
+
+
+def decompress_text(data):
+    return zlib.decompress(base64.b64decode(data)).decode()
+
+
+def blob_ref(text):
+    """Content address of a piece of text."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed store for large tool results, compressed on disk.
+
+    A blob's reference is a 128-bit BLAKE2b hash of its text, so storing the same text
+    twice (the same inventory listing rendered for many sessions, say) keeps
+    one copy. Blobs live under ``directory`` in 256 fan-out subdirectories
+    and are written via a per-process, per-thread temp file and rename, so
+    concurrent writers of the same blob, in one process or several, are
+    harmless.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._known = set()  # References already on disk, to skip the stat on repeated puts
+        self._lock = threading.Lock()
+
+    def _path(self, ref):
+        return os.path.join(self.directory, ref[:2], ref[2:])
+
+    def put(self, text):
+        """Store text and return its reference."""
+        ref = blob_ref(text)
+        if ref in self._known:
+            return ref
+        path = self._path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Thread idents repeat across processes, so the pid keeps workers sharing the directory apart
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(text.encode(), 6))
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._known.add(ref)
+        return ref
+
+    def get(self, ref):
+        """Return the text stored under ref, or None if there is no such blob."""
+        if len(ref) != 32 or not all(c in "0123456789abcdef" for c in ref):
+            return None
+        try:
+            with open(self._path(ref), 'rb') as f:
+                return zlib.decompress(f.read()).decode()
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,218 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Score weights for how a query token matched a catalog token
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+FUZZY_MATCH = 0.6
+INFIX_MATCH = 0.5
+
+
+def normalize_token(token):
+    """Fold simple English plurals so "headphones" and "headphone" index the same."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("es") and token[-3] in "sxz":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [normalize_token(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class ProductCatalog:
+    """Inverted token index over inventory items with prefix and typo-tolerant matching.
+
+    Item names are tokenized once when the item is added. Adjacent token
+    pairs are also indexed joined together, so "powerbank" finds "Power
+    Bank". A query token is resolved against the vocabulary rather than the
+    items: exact hits come from a dict, prefixes from a sorted vocabulary,
+    substrings and typos from a trigram index, typos checked with a bounded
+    edit distance.
+    Lookup cost therefore depends on the query and the vocabulary, not on
+    the number of SKUs.
+    """
+
+    def __init__(self, items=()):
+        self.items = {}
+        self.postings = defaultdict(set)  # token -> item ids
+        self.item_tokens = {}  # item id -> tokens indexed for it
+        self.token_trigrams = defaultdict(set)  # trigram -> tokens
+        self._sorted_vocabulary = None
+        # Keys whose sets are still shared with the catalog this one was derived from
+        self._shared_postings = set()
+        self._shared_trigrams = set()
+        for item in items:
+            self.add_item(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def _own(index, shared, key):
+        """Return index[key] for writing, copying it first if it is shared with a parent catalog."""
+        if key in shared:
+            shared.discard(key)
+            index[key] = set(index[key])
+        return index[key]
+
+    def updated(self, upserts=(), removed_ids=()):
+        """Return a new catalog with the changes applied, leaving this one untouched.
+
+        Only the posting and trigram sets that the changes touch are copied, so
+        deriving a catalog costs a shallow copy of the index dicts plus the
+        work for the changed items, and readers of the old catalog are never
+        affected.
+        """
+        clone = ProductCatalog.__new__(ProductCatalog)
+        clone.items = dict(self.items)
+        clone.postings = defaultdict(set, self.postings)
+        clone.item_tokens = dict(self.item_tokens)
+        clone.token_trigrams = defaultdict(set, self.token_trigrams)
+        clone._sorted_vocabulary = self._sorted_vocabulary
+        clone._shared_postings = set(self.postings)
+        clone._shared_trigrams = set(self.token_trigrams)
+        for item_id in removed_ids:
+            clone.remove_item(item_id)
+        for item in upserts:
+            clone.add_item(item)
+        return clone
+
+    def _index_tokens(self, name):
+        tokens = tokenize(name)
+        # Model numbers are left out of pairs so "speaker 512" does not add "speaker512"
+        joined = [a + b for a, b in zip(tokens, tokens[1:]) if a.isalpha() and b.isalpha()]
+        return set(tokens) | set(joined)
+
+    def add_item(self, item):
+        """Index an item, replacing any existing item with the same id."""
+        if item["id"] in self.items:
+            self.remove_item(item["id"])
+        self.items[item["id"]] = item
+        tokens = self._index_tokens(item["name"])
+        self.item_tokens[item["id"]] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                for gram in trigrams(token):
+                    self._own(self.token_trigrams, self._shared_trigrams, gram).add(token)
+                self._sorted_vocabulary = None
+            self._own(self.postings, self._shared_postings, token).add(item["id"])
+
+    def remove_item(self, item_id):
+        """Drop an item and any vocabulary only it used."""
+        self.items.pop(item_id, None)
+        for token in self.item_tokens.pop(item_id, ()):
+            if token not in self.postings:
+                continue
+            ids = self._own(self.postings, self._shared_postings, token)
+            ids.discard(item_id)
+            if not ids:
+                del self.postings[token]
+                for gram in trigrams(token):
+                    tokens = self._own(self.token_trigrams, self._shared_trigrams, gram)
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.token_trigrams[gram]
+                self._sorted_vocabulary = None
+
+    def _vocabulary(self):
+        if self._sorted_vocabulary is None:
+            self._sorted_vocabulary = sorted(self.postings)
+        return self._sorted_vocabulary
+
+    def _expand(self, token):
+        """Return {catalog token: match weight} for a query token."""
+        matches = {}
+        if token in self.postings:
+            matches[token] = EXACT_MATCH
+
+        if len(token) >= 3:
+            vocabulary = self._vocabulary()
+            i = bisect_left(vocabulary, token)
+            while i < len(vocabulary) and vocabulary[i].startswith(token):
+                matches.setdefault(vocabulary[i], PREFIX_MATCH)
+                i += 1
+
+            # Substring matches ("phone" in "smartphone"): every inner trigram of
+            # the query must appear in the candidate, then confirm containment
+            inner = [token[j:j + 3] for j in range(len(token) - 2)]
+            candidates = set.intersection(*(self.token_trigrams.get(gram, set()) for gram in inner))
+            for candidate in candidates:
+                if token in candidate:
+                    matches.setdefault(candidate, INFIX_MATCH)
+
+        if not matches and len(token) >= 4:
+            limit = 1 if len(token) < 8 else 2
+            grams = trigrams(token)
+            shared = defaultdict(int)
+            for gram in grams:
+                for candidate in self.token_trigrams.get(gram, ()):
+                    shared[candidate] += 1
+            for candidate, count in shared.items():
+                if count * 2 >= len(grams) and edit_distance(token, candidate, limit) <= limit:
+                    matches[candidate] = FUZZY_MATCH
+        return matches
+
+    def search(self, query, limit=10):
+        """Return up to limit items ranked by how well their names match the query."""
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+
+        total = max(len(self.items), 1)
+        # Per query token: [(score, item ids)] for every catalog token it matched
+        token_groups = []
+        for token in query_tokens:
+            groups = []
+            for match, weight in self._expand(token).items():
+                ids = self.postings[match]
+                groups.append((weight * math.log(1 + total / len(ids)), ids))
+            token_groups.append(groups)
+
+        # Prefer items matching every query token; fall back to any token.
+        # Candidate sets are built with set operations before anything is scored.
+        matched = [set().union(*(ids for _, ids in groups)) for groups in token_groups]
+        candidates = set.intersection(*matched)
+        if not candidates:
+            candidates = set().union(*matched)
+
+        scores = dict.fromkeys(candidates, 0.0)
+        for groups in token_groups:
+            # Best match first, so each candidate takes the highest score it qualifies for
+            seen = set()
+            for token_score, ids in sorted(groups, key=lambda group: -group[0]):
+                for item_id in (ids & candidates) - seen:
+                    scores[item_id] += token_score
+                    seen.add(item_id)
+
+        ranked = heapq.nsmallest(limit, candidates, key=lambda item_id: (-scores[item_id], self.items[item_id]["name"]))
+        return [self.items[item_id] for item_id in ranked]
@@ -0,0 +1,150 @@
+import time
+
+from catalog import normalize_token, tokenize
+from agent import (
+    PAYMENT_CONFIG,
+    check_inventory,
+    get_payment_info,
+    get_supported_networks,
+    response_renderer,
+)
+
+
+def words(text):
+    return frozenset(normalize_token(word) for word in text.split())
+
+
+# Words that carry no intent of their own and may appear in any routed message
+FILLER_WORDS = words(
+    "a an the me my i we us you your please can could would will do does is are what which how "
+    "show list give tell get see view let know all to for on in with via using use there here "
+    "want need like of current currently available hi hello hey ok okay thanks"
+)
+
+# Longer messages are rarely a bare request, so they always go to the model
+MAX_ROUTED_TOKENS = 12
+
+
+class IntentRule:
+    """A canned request: at least one trigger word and nothing outside the rule's vocabulary.
+
+    A rule with ``network`` set also needs exactly one supported network
+    named in the message; the others must name none.
+    """
+
+    def __init__(self, name, triggers, vocabulary="", network=False):
+        self.name = name
+        self.triggers = words(triggers)
+        self.vocabulary = self.triggers | words(vocabulary)
+        self.network = network
+
+    def matches(self, tokens, networks):
+        if len(networks) != (1 if self.network else 0):
+            return False
+        return bool(tokens & self.triggers) and tokens <= self.vocabulary
+
+
+# The examples advertised by the inventory and payment skills in __main__.py
+INTENT_RULES = [
+    IntentRule("inventory", "inventory product catalog catalogue item everything",
+               "sell have got full whole entire store shop"),
+    IntentRule("supported_networks", "network method option chain blockchain pay accept",
+               "supported support accepted payment usdc crypto cryptocurrency"),
+    IntentRule("payment_info", "payment pay info information detail address wallet deposit send instructions",
+               "usdc network chain", network=True),
+]
+
+
+class IntentRouter:
+    """Answers unambiguous canned requests straight from the tools, skipping the model round-trip.
+
+    A message is tokenized like catalog searches and filler words are
+    dropped. If exactly one rule matches what is left, its tool runs
+    directly and the reply is its text in milliseconds; anything else,
+    including messages that match several rules or carry extra words such
+    as a product, amount or negation, returns None and goes to the model.
+    Network names are read from the payment config on every call, so
+    config changes apply at once. ``stats`` reports the hit rate.
+    """
+
+    def __init__(self, payment_config, handlers, rules=INTENT_RULES):
+        self.payment_config = payment_config
+        self.handlers = handlers  # Intent name -> async fn(user_id, session_id, network) returning text
+        self.rules = rules
+        self.messages = 0
+        self.fallbacks = 0
+        self.hits = dict.fromkeys(handlers, 0)
+        self.fast_path_seconds = 0.0
+
+    def _network_aliases(self):
+        """Token -> network key for each network's key and the distinctive words of its name."""
+        aliases = {}
+        for key, info in self.payment_config["supported_networks"].items():
+            for token in tokenize(f"{key} {info['name']}"):
+                if len(token) >= 4 and token not in FILLER_WORDS:
+                    aliases.setdefault(token, key)
+        return aliases
+
+    def classify(self, message):
+        """Return (intent, network) for a canned request, or None when the model should handle it."""
+        tokens = [token for token in tokenize(message) if token not in FILLER_WORDS]
+        if not tokens or len(tokens) > MAX_ROUTED_TOKENS:
+            return None
+        aliases = self._network_aliases()
+        networks = {aliases[token] for token in tokens if token in aliases}
+        rest = {token for token in tokens if token not in aliases}
+        matched = [rule.name for rule in self.rules if rule.matches(rest, networks) and rule.name in self.handlers]
+        if len(matched) != 1:
+            return None
+        return matched[0], next(iter(networks), None)
+
+    async def answer(self, message, user_id, session_id):
+        """Answer a canned request directly; returns (intent, reply text) or None to fall back to the model."""
+        self.messages += 1
+        route = self.classify(message)
+        if route is None:
+            self.fallbacks += 1
+            return None
+        intent, network = route
+        start = time.perf_counter()
+        text = await self.handlers[intent](user_id, session_id, network)
+        self.fast_path_seconds += time.perf_counter() - start
+        self.hits[intent] += 1
+        return intent, text
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        return {
+            "messages": self.messages,
+            "hits": hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(hits / self.messages, 4) if self.messages else 0.0,
+            "hits_by_intent": dict(self.hits),
+            "avg_fast_path_ms": round(self.fast_path_seconds * 1000 / hits, 2) if hits else 0.0,
+        }
+
+
+# With TOOL_OUTPUT_FORMAT=json the tools return data for the model to format,
+# so the reply falls back to the same cached markdown the tools render
+async def answer_inventory(user_id, session_id, network):
+    result = await check_inventory(user_id, session_id)
+    return result if isinstance(result, str) else response_renderer.inventory()
+
+
+async def answer_supported_networks(user_id, session_id, network):
+    result = await get_supported_networks(user_id, session_id)
+    return result if isinstance(result, str) else response_renderer.supported_networks()
+
+
+async def answer_payment_info(user_id, session_id, network):
+    result = await get_payment_info(network, user_id, session_id)
+    return result if isinstance(result, str) else response_renderer.payment_info(network)
+
+
+def create_intent_router():
+    """Build the router for the retailer's canned inventory and payment requests."""
+    return IntentRouter(PAYMENT_CONFIG, {
+        "inventory": answer_inventory,
+        "supported_networks": answer_supported_networks,
+        "payment_info": answer_payment_info,
+    })
@@ -0,0 +1,324 @@
+import asyncio
+import csv
+import json
+import math
+import os
+import sqlite3
+import threading
+import heapq
+from bisect import bisect_left, bisect_right
+
+from catalog import ProductCatalog
+
+
+# Columns every inventory source must provide, and how to coerce them
+REQUIRED_FIELDS = {"id": int, "name": str, "price": float, "stock": int}
+
+# Sort orders for listing the inventory, as the key each sorted index is ordered by.
+# Keys end with the id so every key is unique and usable as a pagination cursor.
+SORT_KEYS = {
+    "id": lambda item: (item["id"],),
+    "name": lambda item: (item["name"].lower(), item["id"]),
+    "price_asc": lambda item: (item["price"], item["id"]),
+    "price_desc": lambda item: (-item["price"], item["id"]),
+    "stock_desc": lambda item: (-item["stock"], item["id"]),
+}
+
+# Above this share of changed items, re-sorting beats patching the previous indexes
+RESORT_FRACTION = 0.125
+
+
+def normalize_item(raw):
+    """Coerce a raw row from any source to an item dict; extra columns are kept as-is."""
+    item = dict(raw)
+    for field, cast in REQUIRED_FIELDS.items():
+        if item.get(field) in (None, ""):
+            raise ValueError(f"Inventory item is missing '{field}': {raw}")
+        value = item[field]
+        if cast is int and isinstance(value, str):
+            value = float(value)
+        item[field] = cast(value)
+    return item
+
+
+class InventoryProvider:
+    """Source of inventory items.
+
+    ``load()`` returns the full list of items. ``source_version()`` returns
+    a cheap token that changes whenever the source does (for files, their
+    mtime and size), so callers can skip reloading unchanged sources.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def source_version(self):
+        return None
+
+
+class StaticInventoryProvider(InventoryProvider):
+    """Items held in memory, e.g. the built-in demo catalog."""
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    def load(self):
+        return [normalize_item(item) for item in self.items]
+
+
+class FileInventoryProvider(InventoryProvider):
+    def __init__(self, path):
+        self.path = path
+
+    def _stat(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def source_version(self):
+        return self._stat(self.path)
+
+
+class JsonInventoryProvider(FileInventoryProvider):
+    """A JSON file holding a list of items, or an object with an "items" list."""
+
+    def load(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("items", [])
+        return [normalize_item(row) for row in data]
+
+
+class CsvInventoryProvider(FileInventoryProvider):
+    """A CSV file with a header row containing at least id, name, price and stock."""
+
+    def load(self):
+        with open(self.path, "r", newline="") as f:
+            return [normalize_item(row) for row in csv.DictReader(f)]
+
+
+class SqliteInventoryProvider(FileInventoryProvider):
+    """An ``inventory`` table in a SQLite database, which other tools can update in place."""
+
+    def __init__(self, path, table="inventory"):
+        super().__init__(path)
+        self.table = table
+
+    def source_version(self):
+        # Writes in WAL mode land in the -wal file before a checkpoint touches the database
+        return self._stat(self.path), self._stat(self.path + "-wal")
+
+    def load(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f'SELECT * FROM "{self.table}" ORDER BY id').fetchall()
+        finally:
+            conn.close()
+        return [normalize_item(dict(row)) for row in rows]
+
+
+def create_inventory_provider(source, default_items=()):
+    """Pick a provider from INVENTORY_SOURCE: a .json, .csv or .db/.sqlite path, or empty for the built-in items."""
+    if not source:
+        return StaticInventoryProvider(default_items)
+    extension = os.path.splitext(source)[1].lower()
+    if extension == ".json":
+        return JsonInventoryProvider(source)
+    if extension == ".csv":
+        return CsvInventoryProvider(source)
+    if extension in (".db", ".sqlite", ".sqlite3"):
+        return SqliteInventoryProvider(source)
+    raise ValueError(f"Unsupported inventory source: {source}")
+
+
+def item_category(item):
+    return (item.get("category") or "").lower()
+
+
+class InventorySnapshot:
+    """An immutable view of the inventory: items in source order, an id lookup and the search catalog.
+
+    For listing, the snapshot also keeps one sorted index per entry in
+    SORT_KEYS, both over all items and per category. Each index is a pair of
+    parallel lists (keys, items), so a page starts with a bisect and then
+    reads items in order.
+    """
+
+    def __init__(self, items, by_id, catalog, version, previous=None, changed_ids=()):
+        self.items = items
+        self.by_id = by_id
+        self.catalog = catalog
+        self.version = version
+        self.indexes = {}  # (sort, category or None) -> (keys, items)
+        self._build_indexes(previous, set(changed_ids))
+
+    def _build_indexes(self, previous, changed_ids):
+        patch = previous is not None and len(changed_ids) <= len(self.items) * RESORT_FRACTION
+        for sort, sort_key in SORT_KEYS.items():
+            if patch:
+                # Drop changed or removed items from the previous order and merge in their new versions
+                old_keys, old_items = previous.indexes[(sort, None)]
+                kept = [(key, item["id"]) for key, item in zip(old_keys, old_items) if item["id"] not in changed_ids]
+                updated = sorted((sort_key(self.by_id[item_id]), item_id) for item_id in changed_ids if item_id in self.by_id)
+                pairs = list(heapq.merge(kept, updated))
+                keys = [key for key, _ in pairs]
+                ordered = [self.by_id[item_id] for _, item_id in pairs]
+            else:
+                ordered = sorted(self.items, key=sort_key)
+                keys = [sort_key(item) for item in ordered]
+            self.indexes[(sort, None)] = (keys, ordered)
+
+            # Per-category indexes inherit the order in one pass
+            for key, item in zip(keys, ordered):
+                category = item_category(item)
+                if category:
+                    category_keys, category_items = self.indexes.setdefault((sort, category), ([], []))
+                    category_keys.append(key)
+                    category_items.append(item)
+
+    def categories(self):
+        return sorted({category for sort, category in self.indexes if category is not None})
+
+    def query(self, sort="id", category=None, min_price=None, max_price=None, after=None, limit=50, predicate=None):
+        """Return one page of items as (items, next_key, total).
+
+        after is the key of the last item on the previous page. A price range
+        sorted by price becomes a bisected slice of the index, so a page costs
+        O(log n + limit). Other filters are applied while reading, and then
+        total is None because counting would mean a full scan.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort order: {sort}. Available: {', '.join(SORT_KEYS)}")
+        keys, ordered = self.indexes.get((sort, category.lower() if category else None), ([], []))
+
+        start, stop = 0, len(ordered)
+        in_slice = False
+        if sort == "price_asc":
+            if min_price is not None:
+                start = bisect_left(keys, (min_price,))
+            if max_price is not None:
+                stop = bisect_right(keys, (max_price, math.inf))
+            in_slice = True
+        elif sort == "price_desc":
+            if max_price is not None:
+                start = bisect_left(keys, (-max_price,))
+            if min_price is not None:
+                stop = bisect_right(keys, (-min_price, math.inf))
+            in_slice = True
+        scan_price = not in_slice and (min_price is not None or max_price is not None)
+        total = stop - start if not (scan_price or predicate) else None
+
+        if after is not None:
+            start = max(start, bisect_right(keys, tuple(after)))
+
+        page = []
+        i = start
+        while i < stop and len(page) < limit:
+            item = ordered[i]
+            i += 1
+            if scan_price and ((min_price is not None and item["price"] < min_price)
+                               or (max_price is not None and item["price"] > max_price)):
+                continue
+            if predicate is not None and not predicate(item):
+                continue
+            page.append(item)
+        next_key = keys[i - 1] if len(page) == limit and i < stop else None
+        return page, next_key, total
+
+
+class InventoryStore:
+    """Holds the current inventory snapshot and hot-reloads it when the source changes.
+
+    Readers take ``store.snapshot`` once and use it for the whole request.
+    A reload builds a complete new snapshot off to the side and publishes it
+    with a single attribute assignment, so in-flight requests keep a
+    consistent view and never wait on a reload. Only items that actually
+    changed are re-indexed: price and stock changes reuse the existing
+    catalog entries, the catalog for the new snapshot is derived from the
+    old one copy-on-write, and the sorted listing indexes are patched
+    rather than re-sorted when few items changed.
+    """
+
+    def __init__(self, provider, poll_interval=5.0):
+        self.provider = provider
+        self.poll_interval = poll_interval
+        self._reload_lock = threading.Lock()
+        self._source_version = provider.source_version()
+        items = tuple(provider.load())
+        by_id = {item["id"]: item for item in items}
+        self.snapshot = InventorySnapshot(items, by_id, ProductCatalog(items), version=1)
+        self._task = None
+
+    def items(self):
+        return self.snapshot.items
+
+    def get(self, item_id):
+        return self.snapshot.by_id.get(item_id)
+
+    def reload(self, force=False):
+        """Reload from the provider if its source changed; returns True if a new snapshot was published."""
+        with self._reload_lock:
+            source_version = self.provider.source_version()
+            if not force and source_version == self._source_version:
+                return False
+            try:
+                items = tuple(self.provider.load())
+            except Exception as e:
+                # Keep serving the last good snapshot, e.g. while a file is half written
+                print(f"Error reloading inventory: {e}")
+                return False
+            self._source_version = source_version
+
+            current = self.snapshot
+            by_id = {item["id"]: item for item in items}
+            removed = [item_id for item_id in current.by_id if item_id not in by_id]
+            changed = []
+            renamed = []
+            for item_id, item in by_id.items():
+                old = current.by_id.get(item_id)
+                if old == item:
+                    by_id[item_id] = old  # Unchanged: keep sharing the old dict
+                elif old is None or old["name"] != item["name"]:
+                    renamed.append(item)
+                else:
+                    changed.append(item)
+            if not (removed or changed or renamed) and tuple(current.by_id) == tuple(by_id):
+                return False
+
+            # Only new and renamed items need their tokens indexed; for price or
+            # stock changes the catalog just points at the new item dict
+            catalog = current.catalog.updated(upserts=renamed, removed_ids=removed)
+            for item in changed:
+                catalog.items[item["id"]] = item
+            self.snapshot = InventorySnapshot(
+                tuple(by_id[item["id"]] for item in items), by_id, catalog, current.version + 1,
+                previous=current, changed_ids=[item["id"] for item in changed + renamed] + removed,
+            )
+            return True
+
+    def start(self):
+        """Poll the source for changes in a background task on the running event loop."""
+        if self._task is None and self.poll_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await asyncio.to_thread(self.reload):
+                    print(f"Inventory reloaded (version {self.snapshot.version})")
+            except Exception as e:
+                print(f"Error polling inventory source: {e}")
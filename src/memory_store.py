@@ -0,0 +1,892 @@
+import atexit
+import errno
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # No advisory record locks (Windows), so stores cannot be shared between processes
+    fcntl = None
+
+
+# Byte 0 of a journal's lock file guards appends and compaction; session
+# lock stripes take the bytes after it
+APPEND_LOCK_BYTE = 0
+SESSION_LOCK_STRIPES = 64
+
+
+def lock_byte(fd, byte):
+    """Take an exclusive advisory lock on one byte of a lock file, waiting as long as it takes."""
+    while True:
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, byte)
+            return
+        except OSError as e:
+            # Record locks belong to the whole process, so the kernel reports a
+            # deadlock when two processes each hold a byte one of the other's
+            # threads wants, even though neither thread waits while holding one
+            if e.errno != errno.EDEADLK:
+                raise
+            time.sleep(0.001)
+
+
+def unlock_byte(fd, byte):
+    fcntl.lockf(fd, fcntl.LOCK_UN, 1, byte)
+
+
+class SessionLocks:
+    """Striped per-session locks.
+
+    Session ids hash onto a fixed set of reentrant locks, so memory stays
+    constant however many sessions exist and work on different sessions
+    rarely contends. Given ``lock_fd``, holding a stripe also takes a POSIX
+    record lock on that stripe's byte of the lock file, which excludes other
+    processes sharing the file. Record locks belong to the whole process,
+    so the thread lock in front of each one keeps this process's threads
+    apart, and only the outermost hold of a stripe takes the record lock.
+    """
+
+    def __init__(self, stripes=SESSION_LOCK_STRIPES, lock_fd=None):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._depth = [0] * stripes
+        self._lock_fd = lock_fd
+
+    def _stripe(self, session_id):
+        # crc32 rather than hash(), which is salted differently in every process
+        return zlib.crc32(session_id.encode()) % len(self._locks)
+
+    @contextmanager
+    def hold(self, session_id):
+        stripe = self._stripe(session_id)
+        byte = APPEND_LOCK_BYTE + 1 + stripe
+        with self._locks[stripe]:
+            if self._depth[stripe] == 0 and self._lock_fd is not None:
+                lock_byte(self._lock_fd, byte)
+            self._depth[stripe] += 1
+            try:
+                yield
+            finally:
+                self._depth[stripe] -= 1
+                if self._depth[stripe] == 0 and self._lock_fd is not None:
+                    unlock_byte(self._lock_fd, byte)
+
+
+class MemoryStore:
+    """Storage backend interface used by ConversationMemory.
+
+    Session dicts handed to a store are owned by ConversationMemory and keep
+    changing after they are saved. ConversationMemory mutates a session only
+    while holding ``session_lock(session_id)``; stores take the same lock
+    while they serialize that session and release it before touching the
+    disk. ``lock`` guards shared bookkeeping and is never held while waiting
+    for a session lock, so the lock order is always session lock first.
+    """
+
+    # True when the store keeps sessions on disk and reads them back one at a
+    # time, so dropping a session from RAM actually frees it
+    supports_paging = False
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.session_locks = SessionLocks()
+        self._loaded = {}
+
+    def load(self):
+        """Return every persisted session as a dict of session_id -> session data."""
+        raise NotImplementedError
+
+    def open(self):
+        """Get the store ready for session_ids and load_session."""
+        self._loaded = self.load()
+
+    def session_lock(self, session_id):
+        """Context manager giving the caller exclusive use of one session."""
+        return self.session_locks.hold(session_id)
+
+    def refresh(self):
+        """Catch up with changes other processes made to a shared store; returns the ids of sessions they changed."""
+        return ()
+
+    def session_ids(self):
+        """Return the ids of every persisted session."""
+        return list(self._loaded)
+
+    def has_session(self, session_id):
+        return session_id in self._loaded
+
+    def load_session(self, session_id):
+        """Return one persisted session, or None if it does not exist."""
+        return self._loaded.get(session_id)
+
+    def scan(self):
+        """Yield (session_id, session_data) for every session without keeping them around."""
+        for session_id in self.session_ids():
+            session_data = self.load_session(session_id)
+            if session_data is not None:
+                yield session_id, session_data
+
+    def can_evict(self, session_id):
+        """Return True if the stored copy of a session is current, so callers may drop theirs."""
+        return True
+
+    def save_session(self, session_id, session_data):
+        """Persist the current state of a single session."""
+        self.write_batch({session_id: session_data})
+
+    def delete_session(self, session_id):
+        """Remove a session from the store."""
+        self.write_batch({session_id: None})
+
+    def write_batch(self, batch):
+        """Persist a dict of session_id -> session data, where None deletes the session."""
+        self.commit_batch(self.prepare_batch(batch))
+
+    def prepare_batch(self, batch):
+        """Serialize a batch, taking each session's lock while it is encoded; returns an opaque payload."""
+        raise NotImplementedError
+
+    def commit_batch(self, payload):
+        """Write a payload produced by prepare_batch to disk."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Force any buffered writes to disk."""
+
+    def close(self):
+        """Flush and release any resources held by the store."""
+        self.flush()
+
+
+def write_atomic(path, text):
+    """Write text to path via a temp file and rename so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """Read a snapshot (or a legacy conversation_memory.json) into a dict."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading memory snapshot {path}: {e}")
+        return {}
+
+
+def infer_session_owner(session_id, session_data):
+    """Work out which user a stored session belongs to."""
+    if session_data.get("user_id"):
+        return session_data["user_id"]
+    for conv in session_data.get("conversation_history", []):
+        context = conv.get("context") or {}
+        if context.get("user_id"):
+            return context["user_id"]
+    # Legacy session ids generated as "<user_id>_<timestamp>" or "<user_id>_session_<timestamp>"
+    prefix, _, suffix = session_id.rpartition("_")
+    if prefix and suffix.isdigit():
+        return prefix[:-len("_session")] if prefix.endswith("_session") else prefix
+    return None
+
+
+class JsonFileStore(MemoryStore):
+    """Legacy backend that rewrites the whole memory file on every change.
+
+    Each session's JSON text is kept from when it was last saved, so a write
+    only re-encodes the session that changed (under that session's lock)
+    and joins the cached texts into a file with one session per line.
+    """
+
+    def __init__(self, memory_file):
+        super().__init__()
+        self.memory_file = memory_file
+        self._sessions = {}
+        self._encoded = {}  # session_id -> JSON text of the session as last saved
+        self._write_lock = threading.Lock()
+        self._prepared = 0
+        self._written = 0
+
+    def load(self):
+        self._sessions = read_snapshot(self.memory_file)
+        self._encoded = {session_id: json.dumps(session_data) for session_id, session_data in self._sessions.items()}
+        return self._sessions
+
+    def prepare_batch(self, batch):
+        encoded = {}
+        for session_id, session_data in batch.items():
+            if session_data is not None:
+                with self.session_lock(session_id):
+                    encoded[session_id] = json.dumps(session_data)
+        with self.lock:
+            for session_id, session_data in batch.items():
+                if session_data is None:
+                    self._sessions.pop(session_id, None)
+                    self._encoded.pop(session_id, None)
+                else:
+                    self._sessions[session_id] = session_data
+                    self._encoded[session_id] = encoded[session_id]
+            lines = [f"{json.dumps(session_id)}: {text}" for session_id, text in self._encoded.items()]
+            self._prepared += 1
+            return self._prepared, "{\n" + ",\n".join(lines) + "\n}\n"
+
+    def commit_batch(self, payload):
+        sequence, text = payload
+        with self._write_lock:
+            if sequence < self._written:
+                return  # A copy prepared later, which includes this batch, is already on disk
+            try:
+                write_atomic(self.memory_file, text)
+                self._written = sequence
+            except Exception as e:
+                print(f"Error saving memory: {e}")
+
+
+class JournalStore(MemoryStore):
+    """Append-only journal of per-session records with snapshot compaction.
+
+    Every change appends one JSON line holding the full state of the session
+    that changed, so a write costs O(session) instead of O(all sessions).
+    Records are last-writer-wins per session, which makes replay idempotent:
+    if the process dies between writing a snapshot and replacing the
+    journal, replaying the old journal over the new snapshot is harmless.
+    A torn line left by a crash mid-append is skipped on replay.
+
+    The store does not keep session data in RAM. It only indexes the open
+    file, offset and length of each session's latest record, and
+    load_session reads that one record back, so callers can page cold
+    sessions out. Compaction streams sessions from the old files into the
+    new snapshot one at a time for the same reason.
+
+    Compaction starts once the journal has grown past the snapshot (and
+    ``compact_min_bytes``), so its cost is spread over at least as many
+    appended bytes as it rewrites. The new snapshot is built from the
+    files as they stood when it started, without holding any lock;
+    loads and appends carry on meanwhile. Only the final swap takes the
+    locks, copying the records appended during the pass into the new
+    journal.
+
+    With ``shared=True`` several processes can use the same files. Session
+    locks also become advisory record locks on ``<journal>.lock``, so a
+    read-modify-write of a session in one worker never interleaves with
+    another's. Appends and compaction take a further record lock, and a
+    process first indexes whatever the others appended since it last
+    looked. Compaction renames a new snapshot and journal into place
+    instead of truncating, so other processes can finish reading the files
+    they hold open, and switch to the new ones when they see the journal's
+    inode change. ``refresh`` reports the sessions other
+    processes changed so callers can drop stale copies.
+    """
+
+    supports_paging = True
+
+    def __init__(self, memory_file, journal_file=None, compact_min_bytes=1 << 20, fsync=False, shared=False):
+        super().__init__()
+        if shared and fcntl is None:
+            raise ValueError("Sharing the memory journal between processes needs fcntl advisory locks")
+        self.memory_file = memory_file
+        self.journal_file = journal_file or f"{memory_file}.journal"
+        self.compact_min_bytes = compact_min_bytes
+        self.fsync = fsync
+        self.shared = shared
+        # session_id -> (open file, offset, length, whether it is a journal record);
+        # the offset is None for sessions held in _legacy
+        self._locations = {}
+        self._legacy = {}  # Sessions from an indented snapshot, until the first compaction
+        self._unwritten = {}  # session_id -> prepared records not yet on disk
+        self._changed = {}  # Sessions other processes changed since the last refresh, in journal order
+        self._snapshot_reader = None
+        self._journal_reader = None
+        self._journal_end = 0  # How far the current journal has been indexed
+        self._snapshot_size = 0
+        self._journal = None
+        self._lock_fd = None
+        self._io_lock = threading.Lock()
+        self._compact_lock = threading.Lock()  # One compaction at a time in this process
+        # Batches are appended in the order they were prepared, so a session's
+        # newer record can never land in the journal before an older one
+        self._turn = threading.Condition(self._io_lock)
+        self._next_ticket = 0
+        self._now_serving = 0
+
+    @contextmanager
+    def _append_lock(self):
+        """Keep other processes from appending or compacting; the caller holds _io_lock."""
+        if self._lock_fd is None:
+            yield
+            return
+        lock_byte(self._lock_fd, APPEND_LOCK_BYTE)
+        try:
+            yield
+        finally:
+            unlock_byte(self._lock_fd, APPEND_LOCK_BYTE)
+
+    def load(self):
+        self.open()
+        return {session_id: self.load_session(session_id) for session_id in self.session_ids()}
+
+    def open(self):
+        if self.shared:
+            # One descriptor for all record locks: closing any descriptor of the
+            # lock file would drop every lock this process holds on it
+            self._lock_fd = os.open(f"{self.journal_file}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            self.session_locks = SessionLocks(lock_fd=self._lock_fd)
+        with self._io_lock, self._append_lock():
+            self._locations = {}
+            self._open_files()
+            self._index_snapshot()
+            replayed = self._read_journal_tail()
+        if replayed or self._legacy:
+            # Fold the replayed journal into a fresh snapshot right away
+            self.compact()
+
+    def _open_files(self):
+        """Open the current snapshot and journal; the caller holds _io_lock and the append lock."""
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self.journal_file, 'ab')
+        self._journal_reader = open(self.journal_file, 'rb')
+        self._journal_end = 0
+        self._snapshot_reader = open(self.memory_file, 'rb') if os.path.exists(self.memory_file) else None
+        self._snapshot_size = os.fstat(self._snapshot_reader.fileno()).st_size if self._snapshot_reader else 0
+
+    def _index_snapshot(self):
+        """Record where each session starts in the one-session-per-line snapshot."""
+        reader = self._snapshot_reader
+        if reader is None:
+            return
+        decoder = json.JSONDecoder()
+        offset = 0
+        for raw in reader:
+            line = raw.decode().rstrip("\n").rstrip(",")
+            if line not in ("{", "}", ""):
+                try:
+                    session_id, end = decoder.raw_decode(line)
+                except ValueError:
+                    session_id, end = None, 0
+                if not isinstance(session_id, str) or line[end:end + 2] != ": ":
+                    # An indented conversation_memory.json from an older json backend
+                    self._legacy = read_snapshot(self.memory_file)
+                    self._locations = {session_id: (None, None, None, False) for session_id in self._legacy}
+                    return
+                start = len(line[:end + 2].encode())
+                self._locations[session_id] = (reader, offset + start, len(line.encode()) - start, False)
+            offset += len(raw)
+
+    def _read_journal_tail(self):
+        """Index the complete journal records past _journal_end; returns the ids of the sessions they touch, in order."""
+        touched = {}
+        reader = self._journal_reader
+        offset = self._journal_end
+        reader.seek(offset)
+        for raw in reader:
+            if not raw.endswith(b"\n"):
+                break  # Incomplete final line from a crash mid-append
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                record = None  # A torn line ended by the next append, which starts on a fresh line
+            if record is not None:
+                session_id = record["session_id"]
+                if record.get("deleted"):
+                    self._locations.pop(session_id, None)
+                else:
+                    self._locations[session_id] = (reader, offset, len(raw), True)
+                touched[session_id] = None
+            offset += len(raw)
+        self._journal_end = offset
+        return touched
+
+    def _journal_replaced(self):
+        """True once another process has compacted, leaving our journal handle on an unlinked file."""
+        try:
+            return os.stat(self.journal_file).st_ino != os.fstat(self._journal_reader.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _catch_up(self):
+        """Index what other processes appended, following them to a new journal after a compaction.
+
+        The caller holds _io_lock and the append lock. The old journal is
+        read to its end first, so after another process compacts, its new
+        snapshot holds exactly what we had indexed and can simply be
+        re-indexed in place of the old files.
+        """
+        self._changed.update(self._read_journal_tail())
+        if self._journal_replaced():
+            self._locations = {}
+            self._open_files()
+            self._index_snapshot()
+            self._changed.update(self._read_journal_tail())
+
+    def _read(self, location, session_id):
+        """Return (whether it is a journal record, JSON text) of a session's latest record; the caller holds _io_lock."""
+        reader, offset, length, is_record = location
+        if offset is None:
+            return False, json.dumps(self._legacy[session_id])
+        reader.seek(offset)
+        return is_record, reader.read(length).decode()
+
+    def refresh(self):
+        if not self.shared:
+            return ()
+        with self._io_lock:
+            # Cheap check first, so an idle journal costs two stats rather than a lock round trip
+            if (os.fstat(self._journal_reader.fileno()).st_size != self._journal_end
+                    or self._journal_replaced()):
+                with self._append_lock():
+                    self._catch_up()
+            changed, self._changed = self._changed, {}
+        return list(changed)
+
+    def session_ids(self):
+        with self._io_lock:
+            return list(self._locations)
+
+    def has_session(self, session_id):
+        with self._io_lock:
+            return session_id in self._locations
+
+    def load_session(self, session_id):
+        with self._io_lock:
+            location = self._locations.get(session_id)
+            if location is None:
+                return None
+            is_record, text = self._read(location, session_id)
+        data = json.loads(text)
+        return data["data"] if is_record else data
+
+    def can_evict(self, session_id):
+        with self._io_lock:
+            return session_id not in self._unwritten
+
+    def prepare_batch(self, batch):
+        records = []
+        for session_id, session_data in batch.items():
+            if session_data is None:
+                line = json.dumps({"session_id": session_id, "deleted": True})
+            else:
+                with self.session_lock(session_id):
+                    line = json.dumps({"session_id": session_id, "data": session_data})
+            records.append((session_id, (line + "\n").encode(), session_data is None))
+        with self._io_lock:
+            # Deleting a session this process never saw is a no-op, unless another process may have it
+            records = [
+                record for record in records
+                if not record[2] or self.shared or record[0] in self._locations or record[0] in self._unwritten
+            ]
+            for session_id, _, _ in records:
+                self._unwritten[session_id] = self._unwritten.get(session_id, 0) + 1
+            ticket = self._next_ticket
+            self._next_ticket += 1
+        return ticket, records
+
+    def commit_batch(self, payload):
+        ticket, records = payload
+        with self._turn:
+            self._turn.wait_for(lambda: self._now_serving == ticket)
+            try:
+                if not records:
+                    return
+                try:
+                    with self._append_lock():
+                        if self.shared:
+                            self._catch_up()
+                        offset = os.fstat(self._journal.fileno()).st_size
+                        prefix = b""
+                        if offset != self._journal_end:
+                            # Finish off an incomplete line left by a crash so replay skips it
+                            prefix = b"\n"
+                            offset += 1
+                        self._journal.write(prefix + b"".join(line for _, line, _ in records))
+                        self._journal.flush()
+                        if self.fsync:
+                            os.fsync(self._journal.fileno())
+                except Exception as e:
+                    # The sessions stay marked unwritten, so callers keep them resident
+                    print(f"Error appending to memory journal: {e}")
+                    return
+                for session_id, line, deleted in records:
+                    if deleted:
+                        self._locations.pop(session_id, None)
+                    else:
+                        self._locations[session_id] = (self._journal_reader, offset, len(line), True)
+                    offset += len(line)
+                    self._unwritten[session_id] -= 1
+                    if not self._unwritten[session_id]:
+                        del self._unwritten[session_id]
+                self._journal_end = offset
+                if self._journal_end <= max(self._snapshot_size, self.compact_min_bytes):
+                    return
+            finally:
+                self._now_serving += 1
+                self._turn.notify_all()
+        # Skip it if another thread is already compacting
+        self.compact(wait=False)
+
+    def compact(self, wait=True):
+        """Write all sessions to a new snapshot file and start a new journal holding only what arrived meanwhile."""
+        if not self._compact_lock.acquire(blocking=wait):
+            return
+        tmp_path = f"{self.memory_file}.{os.getpid()}.tmp"
+        journal_tmp_path = f"{self.journal_file}.{os.getpid()}.tmp"
+        try:
+            with self._io_lock:
+                locations = dict(self._locations)
+                legacy = self._legacy
+                journal_reader = self._journal_reader
+                start = self._journal_end
+
+            # Build the snapshot from the files as of `start`. They are only ever
+            # appended to or replaced, never rewritten, and pread leaves the shared
+            # file positions alone, so no lock is needed while reading them
+            offsets = {}
+            with open(tmp_path, 'wb') as out:
+                out.write(b"{\n")
+                offset = 2
+                separator = b""
+                for session_id, (reader, record_offset, length, is_record) in locations.items():
+                    if record_offset is None:
+                        data = json.dumps(legacy[session_id]).encode()
+                    else:
+                        data = os.pread(reader.fileno(), length, record_offset)
+                        if is_record:
+                            data = json.dumps(json.loads(data)["data"]).encode()
+                    prefix = separator + f"{json.dumps(session_id)}: ".encode()
+                    out.write(prefix)
+                    offset += len(prefix)
+                    offsets[session_id] = (offset, len(data))
+                    out.write(data)
+                    offset += len(data)
+                    separator = b",\n"
+                out.write(b"\n}\n")
+                out.flush()
+                os.fsync(out.fileno())
+
+            # The append lock keeps records, from this process or any other, from
+            # landing in the old journal after its tail was copied
+            with self._io_lock, self._append_lock():
+                if self.shared:
+                    self._catch_up()
+                if self._journal_reader is not journal_reader:
+                    return  # Another process compacted first; its snapshot already covers ours
+                tail = os.pread(journal_reader.fileno(), self._journal_end - start, start)
+                with open(journal_tmp_path, 'wb') as out:
+                    out.write(tail)
+                    out.flush()
+                    os.fsync(out.fileno())
+                # If the process dies between the two renames, the old journal is
+                # replayed over the new snapshot, which is harmless.
+                # Replace the journal rather than truncating it, so other processes
+                # can still finish reading the one they have open
+                os.replace(tmp_path, self.memory_file)
+                os.replace(journal_tmp_path, self.journal_file)
+                self._open_files()
+                self._locations = {
+                    session_id: (self._snapshot_reader, offset, length, False)
+                    for session_id, (offset, length) in offsets.items()
+                }
+                self._read_journal_tail()
+                self._legacy = {}
+        except Exception as e:
+            print(f"Error compacting memory journal: {e}")
+        finally:
+            for path in (tmp_path, journal_tmp_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._compact_lock.release()
+
+    def flush(self):
+        with self._io_lock:
+            if self._journal:
+                try:
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                except Exception as e:
+                    print(f"Error flushing memory journal: {e}")
+
+    def close(self):
+        if self._journal:
+            self.compact()
+            with self._io_lock:
+                self._journal.close()
+                self._journal = None
+                self._locations = {}
+                for reader in (self._snapshot_reader, self._journal_reader):
+                    if reader:
+                        reader.close()
+                if self._lock_fd is not None:
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+
+
+class WriteBehindStore(MemoryStore):
+    """Wraps another store and moves its disk writes to a background thread.
+
+    save_session and delete_session only mark the session dirty. The flusher
+    thread wakes every ``flush_interval_ms`` (or as soon as ``max_pending``
+    sessions are dirty), serializes each dirty session once no matter how
+    many times it changed, and hands the batch to the wrapped store in a
+    single write. The trade-off is durability: a crash can lose up to one
+    flush interval of changes.
+    """
+
+    def __init__(self, inner, flush_interval_ms=200, max_pending=100):
+        if getattr(inner, "shared", False):
+            # Other processes would read stale sessions for up to a flush interval
+            raise ValueError("Write-behind cannot wrap a store shared between processes")
+        self.inner = inner
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._dirty = {}
+        self._in_flight = {}  # The batch being written by flush, still served from here until it lands
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def lock(self):
+        return self.inner.lock
+
+    @lock.setter
+    def lock(self, value):
+        self.inner.lock = value
+
+    @property
+    def supports_paging(self):
+        return self.inner.supports_paging
+
+    def session_lock(self, session_id):
+        return self.inner.session_lock(session_id)
+
+    def refresh(self):
+        return self.inner.refresh()
+
+    def load(self):
+        sessions = self.inner.load()
+        self._start()
+        return sessions
+
+    def open(self):
+        self.inner.open()
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="memory-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _pending(self, session_id):
+        """Return (True, data or None) for a session with unflushed changes; the caller holds lock."""
+        for pending in (self._dirty, self._in_flight):
+            if session_id in pending:
+                return True, pending[session_id]
+        return False, None
+
+    def session_ids(self):
+        with self.lock:
+            session_ids = dict.fromkeys(self.inner.session_ids())
+            for pending in (self._in_flight, self._dirty):
+                for session_id, session_data in pending.items():
+                    if session_data is None:
+                        session_ids.pop(session_id, None)
+                    else:
+                        session_ids[session_id] = None
+            return list(session_ids)
+
+    def has_session(self, session_id):
+        with self.lock:
+            found, session_data = self._pending(session_id)
+        return session_data is not None if found else self.inner.has_session(session_id)
+
+    def load_session(self, session_id):
+        with self.lock:
+            found, session_data = self._pending(session_id)
+        return session_data if found else self.inner.load_session(session_id)
+
+    def can_evict(self, session_id):
+        with self.lock:
+            return not self._pending(session_id)[0] and self.inner.can_evict(session_id)
+
+    def write_batch(self, batch):
+        with self.lock:
+            self._dirty.update(batch)
+            pending = len(self._dirty)
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self.lock:
+                if not self._dirty:
+                    return
+                batch, self._dirty = self._dirty, {}
+                self._in_flight = batch
+            # prepare_batch takes each session's lock, which must not be waited on while holding lock
+            try:
+                self.inner.commit_batch(self.inner.prepare_batch(batch))
+            except Exception as e:
+                print(f"Error flushing memory: {e}")
+            finally:
+                with self.lock:
+                    self._in_flight = {}
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        self.inner.close()
+
+
+class SessionCache:
+    """Dict-like view of a store's sessions that keeps only recently used ones in RAM.
+
+    Sessions are loaded from the store on first access and kept in LRU
+    order. Once more than ``max_resident`` are loaded, the least recently
+    used ones are dropped, skipping any the store has not finished writing,
+    and are read back from disk the next time they are needed. A
+    max_resident of 0 keeps everything resident. Callers serialize access
+    with the store's lock.
+    """
+
+    def __init__(self, store, max_resident=0):
+        self.store = store
+        self.max_resident = max_resident
+        self._resident = OrderedDict()
+        self._known = set(store.session_ids())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, session_id):
+        return session_id in self._resident or session_id in self._known
+
+    def __len__(self):
+        return len(self._known)
+
+    def __getitem__(self, session_id):
+        session_data = self.get(session_id)
+        if session_data is None:
+            raise KeyError(session_id)
+        return session_data
+
+    def __setitem__(self, session_id, session_data):
+        self._resident[session_id] = session_data
+        self._resident.move_to_end(session_id)
+        self._known.add(session_id)
+        self._evict()
+
+    def get(self, session_id, default=None):
+        session_data = self._resident.get(session_id)
+        if session_data is not None:
+            self._resident.move_to_end(session_id)
+            self.hits += 1
+            return session_data
+        if session_id not in self._known:
+            return default
+        self.misses += 1
+        session_data = self.store.load_session(session_id)
+        if session_data is None:
+            self._known.discard(session_id)
+            return default
+        self[session_id] = session_data
+        return session_data
+
+    def peek(self, session_id):
+        """Read a session without making it resident or changing the LRU order."""
+        session_data = self._resident.get(session_id)
+        if session_data is None and session_id in self._known:
+            session_data = self.store.load_session(session_id)
+        return session_data
+
+    def pop(self, session_id, default=None):
+        self._known.discard(session_id)
+        return self._resident.pop(session_id, default)
+
+    def invalidate(self, session_id):
+        """Drop the resident copy of a session another process changed, so it is read again."""
+        self._resident.pop(session_id, None)
+        if self.store.has_session(session_id):
+            self._known.add(session_id)
+        else:
+            self._known.discard(session_id)
+
+    def session_ids(self):
+        return list(self._known)
+
+    def resident_count(self):
+        return len(self._resident)
+
+    def _evict(self):
+        excess = len(self._resident) - self.max_resident if self.max_resident else 0
+        if excess <= 0:
+            return
+        # Sessions with writes in flight are skipped, so look a little past the excess
+        for session_id in list(islice(self._resident, excess + 8)):
+            if self.store.can_evict(session_id):
+                del self._resident[session_id]
+                self.evictions += 1
+                excess -= 1
+                if not excess:
+                    return
+
+
+def process_rss_bytes():
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS; ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def create_memory_store(memory_file, backend=None):
+    """Build the store selected by the MEMORY_* environment variables."""
+    backend = (backend or os.getenv("MEMORY_BACKEND", "journal")).lower()
+    shared = os.getenv("MEMORY_MULTIPROCESS", "false").lower() == "true"
+    if backend == "json":
+        if shared:
+            raise ValueError("MEMORY_MULTIPROCESS needs the journal or sqlite memory backend")
+        store = JsonFileStore(memory_file)
+    elif backend == "journal":
+        compact_min_bytes = int(os.getenv("MEMORY_JOURNAL_COMPACT_MIN_BYTES", str(1 << 20)))
+        fsync = os.getenv("MEMORY_FSYNC", "false").lower() == "true"
+        store = JournalStore(memory_file, compact_min_bytes=compact_min_bytes, fsync=fsync, shared=shared)
+    else:
+        raise ValueError(f"Unknown memory backend: {backend}")
+
+    if os.getenv("MEMORY_FLUSH_MODE", "sync").lower() == "write_behind":
+        store = WriteBehindStore(
+            store,
+            flush_interval_ms=int(os.getenv("MEMORY_FLUSH_INTERVAL_MS", "200")),
+            max_pending=int(os.getenv("MEMORY_FLUSH_MAX_PENDING", "100")),
+        )
+    return store
@@ -0,0 +1,237 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    network TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    amount_usdc REAL NOT NULL,
+    checked_at TEXT NOT NULL,
+    claimed_user_id TEXT,
+    claimed_session_id TEXT,
+    claimed_at TEXT,
+    PRIMARY KEY (network, tx_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_payments_claimed_user ON payments (claimed_user_id);
+CREATE TABLE IF NOT EXISTS payment_requests (
+    payment_id TEXT PRIMARY KEY,
+    network TEXT NOT NULL,
+    user_id TEXT,
+    session_id TEXT,
+    expected_amount REAL NOT NULL,
+    payer_address TEXT,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    tx_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_pending ON payment_requests (network, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_tx ON payment_requests (network, tx_hash);
+CREATE TABLE IF NOT EXISTS watcher_checkpoints (
+    network TEXT PRIMARY KEY,
+    last_block INTEGER NOT NULL
+);
+"""
+
+INSERT_OUTCOME = (
+    "INSERT OR IGNORE INTO payments (network, tx_hash, status, amount_usdc, checked_at) VALUES (?, ?, ?, ?, ?)"
+)
+SELECT_PAYMENT = (
+    "SELECT status, amount_usdc, checked_at, claimed_user_id, claimed_session_id, claimed_at "
+    "FROM payments WHERE network = ? AND tx_hash = ?"
+)
+CLAIM_PAYMENT = (
+    "UPDATE payments SET claimed_user_id = ?, claimed_session_id = ?, claimed_at = ? "
+    "WHERE network = ? AND tx_hash = ? AND claimed_session_id IS NULL"
+)
+
+INSERT_REQUEST = (
+    "INSERT INTO payment_requests (payment_id, network, user_id, session_id, expected_amount, payer_address, "
+    "created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SELECT_PENDING_REQUESTS = (
+    "SELECT payment_id, user_id, session_id, expected_amount, payer_address, created_at, expires_at "
+    "FROM payment_requests WHERE network = ? AND status = 'pending' AND expires_at > ? ORDER BY created_at"
+)
+SELECT_SESSION_PENDING_REQUESTS = (
+    "SELECT payment_id, user_id, session_id, expected_amount, payer_address, created_at, expires_at "
+    "FROM payment_requests WHERE network = ? AND session_id = ? AND status = 'pending' AND expires_at > ? "
+    "ORDER BY created_at"
+)
+SELECT_REQUEST_PAID_BY = "SELECT payment_id FROM payment_requests WHERE network = ? AND tx_hash = ?"
+# A transaction pays for at most one request, whichever path settles it first
+MARK_REQUEST_PAID = (
+    "UPDATE payment_requests SET status = 'paid', tx_hash = ? WHERE payment_id = ? AND status = 'pending' "
+    "AND NOT EXISTS (SELECT 1 FROM payment_requests AS paid WHERE paid.network = payment_requests.network "
+    "AND paid.tx_hash = ?)"
+)
+CANCEL_REQUEST = "UPDATE payment_requests SET status = 'cancelled' WHERE payment_id = ? AND status = 'pending'"
+SELECT_CHECKPOINT = "SELECT last_block FROM watcher_checkpoints WHERE network = ?"
+UPSERT_CHECKPOINT = (
+    "INSERT INTO watcher_checkpoints (network, last_block) VALUES (?, ?) "
+    "ON CONFLICT(network) DO UPDATE SET last_block = excluded.last_block"
+)
+
+# Receipt outcomes that can never change once a transaction is mined
+FINAL_STATUSES = ("verified", "failed", "no_payment")
+
+
+class PaymentLedger:
+    """Persistent ledger of on-chain payment checks keyed by (network, tx_hash).
+
+    A mined transaction's receipt never changes, so once a hash has been
+    looked up its outcome is cached here and repeat verifications skip the
+    RPC call entirely. A successful payment is also claimed by the first
+    user/session that verifies it, and any other session presenting the
+    same hash is rejected as a reused payment.
+    """
+
+    def __init__(self, db_path="payment_ledger.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []  # Every thread's connection, so close() can reach them all
+        self._connections_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Still used only by this thread; check_same_thread=False lets close() run elsewhere
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _key(network, tx_hash):
+        return network.lower(), tx_hash.lower()
+
+    def lookup(self, network, tx_hash):
+        """Return the cached outcome for a transaction, or None if it was never checked."""
+        row = self._connect().execute(SELECT_PAYMENT, self._key(network, tx_hash)).fetchone()
+        if row is None:
+            return None
+        status, amount_usdc, checked_at, claimed_user_id, claimed_session_id, claimed_at = row
+        return {
+            "status": status,
+            "amount_usdc": amount_usdc,
+            "checked_at": checked_at,
+            "claimed_user_id": claimed_user_id,
+            "claimed_session_id": claimed_session_id,
+            "claimed_at": claimed_at,
+        }
+
+    def lookup_many(self, network, tx_hashes):
+        """Return cached outcomes for several transactions, None where a hash was never checked."""
+        return [self.lookup(network, tx_hash) for tx_hash in tx_hashes]
+
+    def record_outcome(self, network, tx_hash, status, amount_usdc):
+        """Cache a final receipt outcome; pending or errored lookups are ignored."""
+        self.record_outcomes(network, [(tx_hash, status, amount_usdc)])
+
+    def record_outcomes(self, network, outcomes):
+        """Cache several (tx_hash, status, amount_usdc) outcomes in one transaction."""
+        checked_at = datetime.now().isoformat()
+        rows = [
+            (*self._key(network, tx_hash), status, amount_usdc, checked_at)
+            for tx_hash, status, amount_usdc in outcomes
+            if status in FINAL_STATUSES
+        ]
+        if not rows:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany(INSERT_OUTCOME, rows)
+
+    def claim(self, network, tx_hash, user_id, session_id):
+        """Bind a verified payment to a user/session.
+
+        Returns True if this session now owns the payment (or already did),
+        False if another session claimed it first.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(CLAIM_PAYMENT, (user_id, session_id, datetime.now().isoformat(), *self._key(network, tx_hash)))
+        entry = self.lookup(network, tx_hash)
+        return bool(entry) and entry["claimed_user_id"] == user_id and entry["claimed_session_id"] == session_id
+
+    def add_payment_request(self, payment_id, network, user_id, session_id, expected_amount,
+                            payer_address, created_at, expires_at):
+        """Register a pending payment request for the on-chain watcher to match."""
+        conn = self._connect()
+        with conn:
+            conn.execute(INSERT_REQUEST, (
+                payment_id, network.lower(), user_id, session_id, expected_amount,
+                payer_address.lower() if payer_address else None,
+                created_at.isoformat(), expires_at.isoformat(),
+            ))
+
+    def pending_requests(self, network, session_id=None):
+        """Return unexpired pending payment requests for a network, or one session's on it, oldest first."""
+        now = datetime.now().isoformat()
+        if session_id is None:
+            rows = self._connect().execute(SELECT_PENDING_REQUESTS, (network.lower(), now))
+        else:
+            rows = self._connect().execute(SELECT_SESSION_PENDING_REQUESTS, (network.lower(), session_id, now))
+        return [
+            {
+                "payment_id": payment_id,
+                "network": network.lower(),
+                "user_id": user_id,
+                "session_id": session_id,
+                "expected_amount": expected_amount,
+                "payer_address": payer_address,
+                "created_at": created_at,
+                "expires_at": expires_at,
+            }
+            for payment_id, user_id, session_id, expected_amount, payer_address, created_at, expires_at in rows
+        ]
+
+    def request_paid_by(self, network, tx_hash):
+        """Return the payment_id of the request a transaction already settled, or None."""
+        row = self._connect().execute(SELECT_REQUEST_PAID_BY, self._key(network, tx_hash)).fetchone()
+        return row[0] if row else None
+
+    def mark_request_paid(self, payment_id, tx_hash):
+        """Mark a pending request as paid by tx_hash.
+
+        Returns False if the request was no longer pending or the
+        transaction already paid for another request.
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(MARK_REQUEST_PAID, (tx_hash.lower(), payment_id, tx_hash.lower()))
+        return cursor.rowcount == 1
+
+    def cancel_request(self, payment_id):
+        """Stop matching payments against a pending request; returns False if it was no longer pending."""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(CANCEL_REQUEST, (payment_id,))
+        return cursor.rowcount == 1
+
+    def get_checkpoint(self, network):
+        """Return the last block the watcher fully processed for a network, or None."""
+        row = self._connect().execute(SELECT_CHECKPOINT, (network.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, network, last_block):
+        conn = self._connect()
+        with conn:
+            conn.execute(UPSERT_CHECKPOINT, (network.lower(), last_block))
+
+    def close(self):
+        """Close every thread's database connection; a later call opens a new one."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,161 @@
+import asyncio
+
+from payments import USDC_DECIMALS
+from rpc import RpcError, rpc_registry
+from transfer_logs import TRANSFER_TOPIC, address_topic, decode_transfers
+
+# How far a transfer may differ from the amount due and still match it; amounts due are whole cents
+AMOUNT_TOLERANCE_USDC = 0.005
+
+
+class PaymentWatcher:
+    """Follows USDC Transfer logs to the retailer wallet and settles pending payment requests.
+
+    For every supported network the watcher polls ``eth_getLogs`` over the
+    block range since its last checkpoint, filtered server-side to the USDC
+    contract and to Transfer events whose recipient is the retailer. The
+    transfers in each transaction are summed and settle a pending request
+    only when exactly one unexpired request matches: one expecting this
+    payer, or else the only one with no payer recorded that is due this
+    amount. Ambiguous, short or overpaying transfers are left for manual
+    verification, and a transaction that already settled a request is
+    never matched again. A payment is claimed in the ledger before
+    ``on_payment`` records it; if recording fails it is retried on later
+    polls rather than aborting the range. The checkpoint is only advanced once a range has been
+    fully processed, so a restart resumes where it left off.
+    """
+
+    def __init__(self, payment_config, ledger, on_payment, poll_interval=15.0,
+                 confirmations=3, max_block_range=500):
+        self.payment_config = payment_config
+        self.ledger = ledger
+        self.on_payment = on_payment
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self.max_block_range = max_block_range
+        self._task = None
+        self._stopping = None
+        # (request, transfer) pairs claimed in the ledger whose on_payment failed, retried every poll
+        self._unrecorded = []
+
+    def start(self):
+        """Start polling in a background task on the running event loop."""
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop polling once the network in progress is done, so no settlement is cut off halfway."""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            await self.retry_unrecorded()
+            for network, network_info in self.payment_config["supported_networks"].items():
+                if self._stopping.is_set():
+                    break
+                if not network_info.get("wallet_address"):
+                    continue
+                try:
+                    await self.poll_network(network, network_info)
+                except RpcError as e:
+                    print(f"Payment watcher RPC error on {network}: {e}")
+                except Exception as e:
+                    print(f"Payment watcher error on {network}: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll_network(self, network, network_info):
+        """Process the next block range for one network; returns the number of payments matched."""
+        head = int(await rpc_registry.call(network, "eth_blockNumber", []), 16)
+        safe_head = head - self.confirmations
+        checkpoint = await asyncio.to_thread(self.ledger.get_checkpoint, network)
+        if checkpoint is None:
+            # First run: start from the current head instead of replaying history
+            await asyncio.to_thread(self.ledger.set_checkpoint, network, safe_head)
+            return 0
+
+        from_block = checkpoint + 1
+        if from_block > safe_head:
+            return 0
+        to_block = min(safe_head, from_block + self.max_block_range - 1)
+
+        logs = await rpc_registry.call(network, "eth_getLogs", [{
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "address": network_info["usdc_contract"],
+            "topics": [TRANSFER_TOPIC, None, address_topic(network_info["wallet_address"])],
+        }])
+
+        matched = 0
+        if logs:
+            matched = await self._settle(network, network_info, logs)
+        await asyncio.to_thread(self.ledger.set_checkpoint, network, to_block)
+        return matched
+
+    @staticmethod
+    def _match(pending, payer, amount):
+        """The one pending request this transfer pays, or None if there is no single match."""
+        due = [r for r in pending if abs(r["expected_amount"] - amount) <= AMOUNT_TOLERANCE_USDC]
+        # A request naming this payer wins; requests naming another payer are never theirs
+        for candidates in ([r for r in due if r["payer_address"] == payer],
+                           [r for r in due if r["payer_address"] is None]):
+            if candidates:
+                return candidates[0] if len(candidates) == 1 else None
+        return None
+
+    async def _settle(self, network, network_info, logs):
+        """Match incoming transfers against pending requests, settling only unambiguous matches."""
+        pending = await asyncio.to_thread(self.ledger.pending_requests, network)
+        if not pending:
+            return 0
+
+        # Sum transfers per transaction so a payment split across several
+        # transfers in one transaction is matched as a single payment
+        payments_by_tx = {}
+        for transfer in decode_transfers(logs, network_info["usdc_contract"]):
+            payment = payments_by_tx.setdefault(transfer["tx_hash"], {"payer_address": transfer["from"], "amount": 0})
+            payment["amount"] += transfer["amount"]
+
+        matched = 0
+        for tx_hash, payment in payments_by_tx.items():
+            payer = payment["payer_address"]
+            amount = payment["amount"] / USDC_DECIMALS
+
+            request = self._match(pending, payer, amount)
+            if request is None:
+                continue
+            if not await asyncio.to_thread(self._claim, network, tx_hash, amount, request):
+                continue
+            pending.remove(request)
+            matched += 1
+            await self._record(request, {"tx_hash": tx_hash, "payer_address": payer, "amount_usdc": amount})
+        return matched
+
+    async def _record(self, request, transfer):
+        """Hand a claimed payment to on_payment; a failure is logged and retried on the next poll."""
+        try:
+            await self.on_payment(request, transfer)
+        except Exception as e:
+            print(f"Payment watcher could not record payment {request['payment_id']}: {e}")
+            self._unrecorded.append((request, transfer))
+
+    async def retry_unrecorded(self):
+        """Retry on_payment for payments already claimed in the ledger whose recording failed."""
+        unrecorded, self._unrecorded = self._unrecorded, []
+        for request, transfer in unrecorded:
+            await self._record(request, transfer)
+
+    def _claim(self, network, tx_hash, amount, request):
+        """Record the transfer in the ledger and bind it to the request's session."""
+        if self.ledger.request_paid_by(network, tx_hash):
+            return False  # A manual verification already settled an order with it
+        self.ledger.record_outcome(network, tx_hash, "verified", amount)
+        if not self.ledger.claim(network, tx_hash, request["user_id"], request["session_id"]):
+            return False  # Already used for another order
+        return self.ledger.mark_request_paid(request["payment_id"], tx_hash)
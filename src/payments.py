@@ -0,0 +1,104 @@
+import asyncio
+
+from rpc import RpcError, rpc_registry
+from transfer_logs import total_received
+
+
+# USDC has 6 decimals
+USDC_DECIMALS = 10 ** 6
+
+# Most public nodes cap JSON-RPC batches at around 100 calls
+MAX_BATCH_SIZE = 100
+
+
+def parse_duration(text):
+    """Convert a human duration such as "30 minutes" into seconds."""
+    units = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+    amount, unit = text.split()
+    return float(amount) * units[unit.lower().rstrip("s")]
+
+
+async def fetch_receipts(network, tx_hashes):
+    """Fetch transaction receipts for many hashes using batched JSON-RPC requests.
+
+    Only receipts are requested: status and logs are all verification needs,
+    so the transaction body itself is never downloaded. Returns a list in the
+    same order as tx_hashes holding the receipt dict, None for unknown or
+    pending transactions, or an RpcError.
+    """
+    receipts = []
+    for start in range(0, len(tx_hashes), MAX_BATCH_SIZE):
+        chunk = tx_hashes[start:start + MAX_BATCH_SIZE]
+        receipts.extend(await rpc_registry.batch(
+            network, [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in chunk]
+        ))
+    return receipts
+
+
+def check_usdc_receipt(receipt, network_info):
+    """Check a receipt for a USDC transfer to the retailer wallet.
+
+    Returns a dict with a ``status`` of verified, no_payment, failed,
+    not_found or error, and the ``amount_usdc`` received. The outcome does
+    not depend on the order amount, so final outcomes can be cached.
+    """
+    if isinstance(receipt, RpcError):
+        return {"status": "error", "amount_usdc": 0.0, "error": str(receipt)}
+    if receipt is None:
+        return {"status": "not_found", "amount_usdc": 0.0}
+    if int(receipt["status"], 16) != 1:
+        return {"status": "failed", "amount_usdc": 0.0}
+
+    # Sum every USDC transfer to us; a payment may be split across several transfers
+    amount_received = total_received(receipt["logs"], network_info["usdc_contract"], network_info["wallet_address"])
+    if not amount_received:
+        return {"status": "no_payment", "amount_usdc": 0.0}
+    return {"status": "verified", "amount_usdc": amount_received / USDC_DECIMALS}
+
+
+def apply_expected_amount(outcome, expected_amount):
+    """Return a copy of a receipt outcome, downgraded to insufficient if it paid too little."""
+    result = dict(outcome)
+    if result["status"] == "verified" and result["amount_usdc"] < expected_amount:
+        result["status"] = "insufficient"
+    return result
+
+
+async def verify_usdc_payments(tx_hashes, network, network_info, expected_amounts=None, ledger=None):
+    """Verify many USDC payments on one network with batched receipt lookups.
+
+    expected_amounts is a list parallel to tx_hashes; when omitted any
+    positive transfer to the retailer counts as verified. When a ledger is
+    given, hashes with a cached final outcome are answered from it and only
+    the rest go to the chain; new final outcomes are recorded.
+    """
+    if expected_amounts is None:
+        expected_amounts = [0.0] * len(tx_hashes)
+    if len(expected_amounts) != len(tx_hashes):
+        raise ValueError("expected_amounts must have one entry per tx_hash")
+
+    if ledger:
+        outcomes = await asyncio.to_thread(ledger.lookup_many, network, tx_hashes)
+    else:
+        outcomes = [None] * len(tx_hashes)
+
+    missing = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    if missing:
+        try:
+            receipts = await fetch_receipts(network, [tx_hashes[i] for i in missing])
+        except RpcError as e:
+            receipts = [e] * len(missing)
+        for i, receipt in zip(missing, receipts):
+            outcomes[i] = check_usdc_receipt(receipt, network_info)
+        if ledger:
+            await asyncio.to_thread(ledger.record_outcomes, network, [
+                (tx_hashes[i], outcomes[i]["status"], outcomes[i]["amount_usdc"]) for i in missing
+            ])
+
+    results = []
+    for tx_hash, outcome, expected_amount in zip(tx_hashes, outcomes, expected_amounts):
+        result = apply_expected_amount(outcome, expected_amount)
+        result["tx_hash"] = tx_hash
+        result["expected_amount"] = expected_amount
+        results.append(result)
+    return results
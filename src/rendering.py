@@ -0,0 +1,144 @@
+import tool_results
+
+
+class ResponseRenderer:
+    """Pre-rendered tool responses that only change with the inventory or payment config.
+
+    Each rendered string is cached together with the versions it was built
+    from: the inventory snapshot version and reservation stock version for
+    the inventory listing, and ``config_version`` for network and payment
+    text. A call whose versions still match is a dictionary lookup.
+    Anything that changes ``PAYMENT_CONFIG`` must call ``invalidate_config``.
+    """
+
+    def __init__(self, payment_config, inventory_store, reservation_engine):
+        self.payment_config = payment_config
+        self.inventory_store = inventory_store
+        self.reservation_engine = reservation_engine
+        self.config_version = 1
+        self._cache = {}  # name -> (versions, text)
+
+    def invalidate_config(self):
+        self.config_version += 1
+
+    def _cached(self, name, versions, build):
+        entry = self._cache.get(name)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+        text = build()
+        self._cache[name] = (versions, text)
+        return text
+
+    def inventory(self):
+        """The full inventory listing with reservable stock."""
+        # Expire lapsed holds first so the stock version is current before it is read
+        self.reservation_engine.expire_due()
+        snapshot = self.inventory_store.snapshot
+        versions = (snapshot.version, self.reservation_engine.stock_version)
+        return self._cached("inventory", versions, lambda: self._build_inventory(snapshot))
+
+    def _build_inventory(self, snapshot):
+        available = self.reservation_engine.available
+        lines = ["📦 **Current Inventory:**\n\n"]
+        lines.extend(
+            f"• **{item['name']}** (ID: {item['id']}) - ${item['price']:.2f} (Stock: {available(item['id'])})\n"
+            for item in snapshot.indexes[("id", None)][1]
+        )
+        return "".join(lines)
+
+    def inventory_page(self, page):
+        """Markdown for one page of a filtered or paginated inventory listing."""
+        items = tool_results.page_items(page)
+        if not items:
+            return "❌ No products match these filters"
+        shown = f"{len(items)} of {page['total']}" if page["total"] is not None else f"{len(items)}"
+        lines = [f"📦 **Current Inventory (showing {shown}):**\n\n"]
+        lines.extend(
+            f"• **{item['name']}** (ID: {item['id']}) - ${item['price']:.2f} (Stock: {item['stock']})\n"
+            for item in items
+        )
+        if page["next_cursor"]:
+            lines.append(f"\nMore items available - next page cursor: `{page['next_cursor']}`\n")
+        return "".join(lines)
+
+    def supported_networks(self):
+        return self._cached("networks", self.config_version, self._build_supported_networks)
+
+    def _build_supported_networks(self):
+        config = self.payment_config
+        lines = ["🌐 **Supported Payment Networks:**\n\n"]
+        for network_key, network_info in config["supported_networks"].items():
+            lines.append(f"**{network_info['name']}** ({network_key})\n")
+            lines.append(f"• Chain ID: {network_info['chain_id']}\n")
+            lines.append(f"• Network Fee: {network_info['network_fee']}\n")
+            lines.append(f"• Confirmation Time: {network_info['confirmation_time']}\n\n")
+        default_name = config["supported_networks"][config["default_network"]]["name"]
+        lines.append(f"**💡 Recommended:** {default_name} (Low fees, fast confirmations)\n\n")
+        lines.append("**📝 To get payment address:** Ask for 'payment info' and specify the network\n")
+        lines.append("Example: 'I want to pay with USDC on Polygon'\n")
+        return "".join(lines)
+
+    def supported_networks_data(self):
+        """Structured form of supported_networks for TOOL_OUTPUT_FORMAT=json."""
+        return self._cached("networks_data", self.config_version, self._build_supported_networks_data)
+
+    def _build_supported_networks_data(self):
+        config = self.payment_config
+        return {
+            "networks": [
+                {
+                    "network": network_key,
+                    "name": network_info["name"],
+                    "chain_id": network_info["chain_id"],
+                    "fee": network_info["network_fee"],
+                    "confirmation_time": network_info["confirmation_time"],
+                }
+                for network_key, network_info in config["supported_networks"].items()
+            ],
+            "recommended": config["default_network"],
+        }
+
+    def payment_info_data(self, network_key):
+        """Structured payment details for one network, without the instructional boilerplate."""
+        base = self._cached(("payment_info_data", network_key), self.config_version,
+                            lambda: self._build_payment_info_data(network_key))
+        return dict(base)  # Callers add order details
+
+    def _build_payment_info_data(self, network_key):
+        config = self.payment_config
+        network_info = config["supported_networks"][network_key]
+        return {
+            "network": network_key,
+            "chain_id": network_info["chain_id"],
+            "currency": "USDC",
+            "wallet_address": network_info["wallet_address"],
+            "usdc_contract": network_info["usdc_contract"],
+            "minimum_payment": config["minimum_payment"],
+            "payment_timeout": config["payment_timeout"],
+        }
+
+    def payment_info(self, network_key):
+        """The static payment instructions for one network."""
+        return self._cached(("payment_info", network_key), self.config_version,
+                            lambda: self._build_payment_info(network_key))
+
+    def _build_payment_info(self, network_key):
+        config = self.payment_config
+        network_info = config["supported_networks"][network_key]
+        return "".join([
+            f"💳 **Payment Information - {network_info['name']}**\n\n",
+            "**💰 Accepted Currency:** USDC only\n",
+            f"**🔗 Network:** {network_info['name']} (Chain ID: {network_info['chain_id']})\n",
+            f"**📍 Wallet Address:** `{network_info['wallet_address']}`\n",
+            f"**📄 USDC Contract:** `{network_info['usdc_contract']}`\n\n",
+            "**📊 Network Details:**\n",
+            f"• Network Fee: {network_info['network_fee']}\n",
+            f"• Confirmation Time: {network_info['confirmation_time']}\n",
+            f"• Minimum Payment: ${config['minimum_payment']:.2f} USDC\n",
+            f"• Payment Timeout: {config['payment_timeout']}\n\n",
+            "**⚠️ Important:**\n",
+            "• Only send USDC tokens to this address\n",
+            f"• Ensure you're on the correct network ({network_info['name']})\n",
+            "• Include your order reference in the transaction memo if possible\n",
+            "• Double-check the wallet address before sending\n",
+        ])
@@ -0,0 +1,179 @@
+import heapq
+import threading
+import time
+
+
+class ReservationError(Exception):
+    """Raised when stock cannot be reserved for an order."""
+
+
+class ReservationEngine:
+    """Holds stock for pending orders so two buyers cannot pay for the same unit.
+
+    ``reserve`` takes stock out of the available pool when payment details
+    are issued, ``commit`` turns the hold into a sale once the payment is
+    verified, and holds that are neither committed nor released expire
+    after ``ttl_seconds``. Expiries sit in a min-heap and are swept lazily
+    before any stock is read, so no timer thread is needed. A reservation
+    is forgotten one more TTL after it expires, which leaves a window for
+    late payments to still be matched.
+
+    Every change to a SKU's counters happens under that SKU's lock, so
+    orders for different products never contend. Available stock is the
+    inventory's stock minus held and sold units. When the inventory source
+    reports a new stock figure for a SKU (a restock or recount), the sold
+    count for that SKU starts again from zero.
+    """
+
+    def __init__(self, inventory_store, ttl_seconds, clock=time.monotonic):
+        self.inventory_store = inventory_store
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.reservations = {}  # reservation id -> reservation dict
+        self._held = {}  # item id -> units held by pending orders
+        self._sold = {}  # item id -> units sold since the source last changed its stock
+        self._base_stock = {}  # item id -> stock figure the sold count applies to
+        self._sku_locks = {}
+        self._locks_lock = threading.Lock()
+        self._expiries = []  # heap of (due time, reservation id, forget)
+        self._expiry_lock = threading.Lock()
+        # Bumped after every change to available stock, so rendered stock levels can be cached
+        self.stock_version = 0
+        self._version_lock = threading.Lock()
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.stock_version += 1
+
+    def _sku_lock(self, item_id):
+        lock = self._sku_locks.get(item_id)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._sku_locks.setdefault(item_id, threading.Lock())
+        return lock
+
+    def _available_locked(self, item):
+        """Available units for an item; the caller holds its SKU lock."""
+        item_id = item["id"]
+        if self._base_stock.get(item_id) != item["stock"]:
+            self._base_stock[item_id] = item["stock"]
+            self._sold[item_id] = 0
+            self._bump_version()
+        return max(0, item["stock"] - self._held.get(item_id, 0) - self._sold.get(item_id, 0))
+
+    def available(self, item_id):
+        """Units of an item that can still be reserved."""
+        self.expire_due()
+        item = self.inventory_store.get(item_id)
+        if item is None:
+            return 0
+        with self._sku_lock(item_id):
+            return self._available_locked(item)
+
+    def reserve(self, reservation_id, item_id, quantity, owner=None):
+        """Hold quantity units of an item; raises ReservationError if they are not available."""
+        if quantity < 1:
+            raise ReservationError("Quantity must be at least 1")
+        self.expire_due()
+        item = self.inventory_store.get(item_id)
+        if item is None:
+            raise ReservationError(f"Unknown product id {item_id}")
+
+        with self._sku_lock(item_id):
+            available = self._available_locked(item)
+            if quantity > available:
+                raise ReservationError(f"Only {available} of {item['name']} available")
+            self._held[item_id] = self._held.get(item_id, 0) + quantity
+            expires_at = self.clock() + self.ttl_seconds
+            reservation = {
+                "reservation_id": reservation_id,
+                "item_id": item_id,
+                "quantity": quantity,
+                "unit_price": item["price"],
+                "owner": owner,
+                "status": "held",
+                "expires_at": expires_at,
+            }
+            self.reservations[reservation_id] = reservation
+            self._bump_version()
+
+        with self._expiry_lock:
+            heapq.heappush(self._expiries, (expires_at, reservation_id, False))
+        return dict(reservation)
+
+    def _end_hold(self, reservation, status):
+        """Move a held reservation to a final status; the caller holds its SKU lock."""
+        if reservation["status"] != "held":
+            return False
+        self._held[reservation["item_id"]] -= reservation["quantity"]
+        reservation["status"] = status
+        self._bump_version()
+        return True
+
+    def commit(self, reservation_id):
+        """Turn a hold into a sale after payment.
+
+        A hold that already expired is re-taken if the stock is still there.
+        Returns False when the reservation is unknown, was released (its
+        order was cancelled) or the units are gone.
+        """
+        self.expire_due()
+        reservation = self.reservations.get(reservation_id)
+        if reservation is None:
+            return False
+        item_id = reservation["item_id"]
+        with self._sku_lock(item_id):
+            if reservation["status"] == "committed":
+                return True
+            if reservation["status"] == "released":
+                return False
+            if reservation["status"] == "held":
+                self._end_hold(reservation, "committed")
+            else:
+                # Paid after the hold lapsed: only sell if nobody else took the units
+                item = self.inventory_store.get(item_id)
+                if item is None or self._available_locked(item) < reservation["quantity"]:
+                    return False
+                reservation["status"] = "committed"
+            self._sold[item_id] = self._sold.get(item_id, 0) + reservation["quantity"]
+            self._bump_version()
+            return True
+
+    def release(self, reservation_id):
+        """Give a held reservation's units back, e.g. when the order is cancelled."""
+        reservation = self.reservations.get(reservation_id)
+        if reservation is None:
+            return False
+        with self._sku_lock(reservation["item_id"]):
+            return self._end_hold(reservation, "released")
+
+    def expire_due(self):
+        """Release every hold whose TTL has passed; returns how many expired."""
+        now = self.clock()
+        if not self._expiries or self._expiries[0][0] > now:
+            return 0
+        due = []
+        with self._expiry_lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                due.append(heapq.heappop(self._expiries))
+        expired = 0
+        forget_later = []
+        for due_at, reservation_id, forget in due:
+            reservation = self.reservations.get(reservation_id)
+            if reservation is None:
+                continue
+            with self._sku_lock(reservation["item_id"]):
+                if forget:
+                    self.reservations.pop(reservation_id, None)
+                    continue
+                expired += self._end_hold(reservation, "expired")
+            forget_later.append((due_at + self.ttl_seconds, reservation_id, True))
+        if forget_later:
+            with self._expiry_lock:
+                for entry in forget_later:
+                    heapq.heappush(self._expiries, entry)
+        return expired
+
+    def get(self, reservation_id):
+        reservation = self.reservations.get(reservation_id)
+        return dict(reservation) if reservation else None
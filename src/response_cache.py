@@ -0,0 +1,126 @@
+import os
+import time
+from collections import OrderedDict
+
+from catalog import tokenize
+from intent_router import FILLER_WORDS
+from agent import duration_env, inventory_store, reservation_engine, response_renderer
+
+# Tools whose results depend only on the catalog and payment config, so replies built from them can be shared
+SHARED_TOOLS = frozenset({"check_inventory", "search_product", "get_supported_networks"})
+
+# Tools that read the buyer's own history; replies using them are only served back to that buyer
+PERSONAL_TOOLS = frozenset({"get_conversation_context"})
+
+
+def query_key(message):
+    """The meaningful words of a message, ignoring order, case, plurals and filler."""
+    return frozenset(token for token in tokenize(message) if token not in FILLER_WORDS)
+
+
+class ResponseCache:
+    """LRU cache of model replies to the first message of a conversation, with a TTL.
+
+    Entries are keyed on the message's normalized word set, so "what
+    headphones do you have?" and "do you have headphones" share one. Only
+    opening messages are cached: later replies depend on the turns before
+    them. A reply is stored only if every tool the model called is a
+    catalog lookup (shared between users) or the buyer's own history
+    (served back to that user only). Replies that used payment, preference
+    or web search tools, or that echo the user, session or context id, are
+    never cached. ``versions`` returns the catalog and
+    config versions the replies were built from; the cache empties when
+    they change, and a reply is dropped if they changed while it was being
+    generated.
+    """
+
+    def __init__(self, versions, max_entries=1000, ttl_seconds=300, clock=time.monotonic):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()  # (word set, user id or None) -> (expires_at, reply), least recently used first
+        self._versions = None
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.invalidations = 0
+
+    def _current_versions(self):
+        """Empty the cache if the catalog or config changed since it was filled; returns the versions."""
+        versions = self.versions()
+        if versions != self._versions:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._versions = versions
+        return versions
+
+    def get(self, message, user_id, new_conversation):
+        """Look up a reply; returns (reply or None, versions to pass back to put)."""
+        tokens = query_key(message)
+        if not new_conversation or not tokens:
+            return None, None
+        versions = self._current_versions()
+        now = self.clock()
+        # A reply anyone may see first, then one built from this user's history
+        for key in ((tokens, None), (tokens, user_id)):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._entries[key]
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], versions
+        self.misses += 1
+        return None, versions
+
+    def put(self, message, user_id, versions, tools_used, reply, private_values=()):
+        """Store a model reply if it is safe to serve again; returns whether it was stored."""
+        tokens = query_key(message)
+        if versions is None or not tokens or not reply.strip() or not tools_used <= SHARED_TOOLS | PERSONAL_TOOLS:
+            return False
+        if any(value and value in reply for value in private_values):
+            return False
+        # Stock or prices changed while the model was answering, so the reply may already be stale
+        if self._current_versions() != versions:
+            return False
+        key = (tokens, user_id if tools_used & PERSONAL_TOOLS else None)
+        self._entries[key] = (self.clock() + self.ttl_seconds, reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.stored += 1
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stored": self.stored,
+            "invalidations": self.invalidations,
+        }
+
+
+def catalog_versions():
+    """Versions of everything a shared reply is built from: inventory, reservable stock and payment config."""
+    # Expire lapsed holds first so the stock version is current, as the renderer does
+    reservation_engine.expire_due()
+    return inventory_store.snapshot.version, reservation_engine.stock_version, response_renderer.config_version
+
+
+def create_response_cache():
+    """Build the reply cache from RESPONSE_CACHE_*; None when RESPONSE_CACHE_MAX_ENTRIES is 0."""
+    max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    if max_entries <= 0:
+        return None
+    return ResponseCache(
+        catalog_versions,
+        max_entries=max_entries,
+        ttl_seconds=duration_env("RESPONSE_CACHE_TTL") or 300,
+    )
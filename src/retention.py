@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+
+
+class RetentionPolicy:
+    """Rules the memory sweeper enforces; a limit of 0 disables that rule.
+
+    session_ttl expires sessions idle for that many seconds.
+    max_sessions_per_user keeps only a user's newest sessions (the active one
+    is never removed). payment_archive_after moves settled or lapsed payment
+    records older than that many seconds out of their session and into the
+    payment archive. Payment records are always archived, never dropped,
+    including when their session expires.
+    """
+
+    def __init__(self, session_ttl=0, max_sessions_per_user=0, payment_archive_after=0):
+        self.session_ttl = session_ttl
+        self.max_sessions_per_user = max_sessions_per_user
+        self.payment_archive_after = payment_archive_after
+
+    def enabled(self):
+        return bool(self.session_ttl or self.max_sessions_per_user or self.payment_archive_after)
+
+    @staticmethod
+    def _cutoff(now, seconds):
+        return (now - timedelta(seconds=seconds)).isoformat()
+
+    def session_expired(self, last_active, now):
+        return bool(self.session_ttl and last_active and last_active < self._cutoff(now, self.session_ttl))
+
+    def payment_archivable(self, payment, now):
+        if not self.payment_archive_after or not payment.get("timestamp"):
+            return False
+        if payment["timestamp"] >= self._cutoff(now, self.payment_archive_after):
+            return False
+        # A pending request stays with its session until the watcher can no longer match it
+        return payment.get("status") != "pending" or (payment.get("expires_at") or "") < now.isoformat()
+
+
+def session_last_active(session_data):
+    """Timestamp of the last change to a session, for sessions stored before last_active was tracked too."""
+    if session_data.get("last_active"):
+        return session_data["last_active"]
+    history = session_data.get("conversation_history")
+    if history:
+        return history[-1]["timestamp"]
+    return session_data.get("created_at")
+
+
+class PaymentArchive:
+    """Append-only JSON-lines file of payment records removed from conversation memory."""
+
+    def __init__(self, path="payment_archive.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, session_id, user_id, payments, reason):
+        if not payments:
+            return 0
+        archived_at = datetime.now().isoformat()
+        lines = "".join(
+            json.dumps({
+                "archived_at": archived_at,
+                "reason": reason,
+                "session_id": session_id,
+                "user_id": payment.get("user_id") or user_id,
+                "payment": payment,
+            }) + "\n"
+            for payment in payments
+        )
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(lines)
+                f.flush()
+        return len(payments)
+
+
+class MemorySweeper:
+    """Background task that applies a RetentionPolicy to conversation memory a little at a time.
+
+    Every ``interval`` seconds it asks the memory to sweep the next
+    ``batch_size`` sessions in round-robin order, so each tick does bounded
+    work and no pass ever stops the world. Counters of what was removed
+    are kept in ``stats``.
+    """
+
+    def __init__(self, memory, policy, archive, interval=5.0, batch_size=200):
+        self.memory = memory
+        self.policy = policy
+        self.archive = archive
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stats = {"scanned": 0, "expired_sessions": 0, "trimmed_sessions": 0, "archived_payments": 0}
+        self._task = None
+        self._stopping = None
+
+    def sweep(self):
+        """Run one bounded sweep step; returns the counts for this step."""
+        counts = self.memory.sweep(self.policy, self.archive, self.batch_size)
+        for key, value in counts.items():
+            self.stats[key] = self.stats.get(key, 0) + value
+        return counts
+
+    def start(self):
+        if self._task is None and self.interval > 0 and self.policy.enabled():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop sweeping; a batch already running in its thread is allowed to finish first."""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Error sweeping conversation memory: {e}")
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+
+# Public RPC endpoints used when no RPC_URLS_<NETWORK> override is set
+DEFAULT_RPC_URLS = {
+    "ethereum": ["https://eth.llamarpc.com"],
+    "polygon": ["https://polygon-rpc.com"],
+    "arbitrum": ["https://arb1.arbitrum.io/rpc"],
+}
+
+
+class RpcError(Exception):
+    """JSON-RPC error returned by a node, or every endpoint for a network failing."""
+
+
+class RpcEndpoint:
+    """A single JSON-RPC URL with its own timeout and failure cooldown."""
+
+    def __init__(self, url, timeout, cooldown):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cooldown = cooldown
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + self.cooldown
+
+
+class NetworkRpcPool:
+    """Ordered list of endpoints for one network, tried in turn until one answers."""
+
+    def __init__(self, network, endpoints, registry):
+        self.network = network
+        self.endpoints = endpoints
+        self.registry = registry
+        self._next_id = 1
+
+    def _candidates(self):
+        # Healthy endpoints first; endpoints in cooldown are still tried last
+        # rather than failing outright when everything is marked down
+        healthy = [e for e in self.endpoints if e.available]
+        return healthy + [e for e in self.endpoints if not e.available]
+
+    async def _post(self, payload):
+        """POST a JSON-RPC payload, failing over across endpoints on transport errors."""
+        session = await self.registry.get_session()
+        errors = []
+        for endpoint in self._candidates():
+            try:
+                async with session.post(endpoint.url, json=payload, timeout=endpoint.timeout) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                endpoint.mark_down()
+                errors.append(f"{endpoint.url}: {e!r}")
+        raise RpcError(f"All {self.network} RPC endpoints failed - {'; '.join(errors)}")
+
+    def _reserve_ids(self, count):
+        """Hand out a block of request ids; safe on one event loop since it never awaits."""
+        first_id = self._next_id
+        self._next_id += count
+        return first_id
+
+    async def call(self, method, params):
+        """Send one JSON-RPC request and return its result."""
+        request_id = self._reserve_ids(1)
+        response = await self._post({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        if response.get("error"):
+            raise RpcError(f"{method} failed: {response['error'].get('message', response['error'])}")
+        return response.get("result")
+
+    async def batch(self, calls):
+        """Send several (method, params) calls as one JSON-RPC batch request.
+
+        Returns results in the same order as calls. A call the node rejected
+        is returned as an RpcError instance instead of raising, so one bad
+        entry does not fail the whole batch.
+        """
+        if not calls:
+            return []
+        first_id = self._reserve_ids(len(calls))
+        payload = [
+            {"jsonrpc": "2.0", "id": first_id + offset, "method": method, "params": params}
+            for offset, (method, params) in enumerate(calls)
+        ]
+        responses = await self._post(payload)
+        if not isinstance(responses, list):
+            error = (responses or {}).get("error") or responses
+            raise RpcError(f"Batch request rejected: {error}")
+
+        results = [RpcError("No response for batched call")] * len(calls)
+        for response in responses:
+            index = response.get("id", 0) - first_id
+            if not 0 <= index < len(calls):
+                continue
+            if response.get("error"):
+                results[index] = RpcError(f"{calls[index][0]} failed: {response['error'].get('message', response['error'])}")
+            else:
+                results[index] = response.get("result")
+        return results
+
+
+class RpcRegistry:
+    """Process-wide registry of per-network RPC pools sharing one keep-alive HTTP session."""
+
+    def __init__(self, urls_by_network, timeout=10.0, cooldown=30.0, connection_limit=100):
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.connection_limit = connection_limit
+        self.pools = {
+            network: NetworkRpcPool(network, [RpcEndpoint(url, timeout, cooldown) for url in urls], self)
+            for network, urls in urls_by_network.items()
+        }
+        self._session = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a registry from RPC_URLS_<NETWORK> (comma separated) and RPC_* settings."""
+        urls_by_network = {}
+        for network, default_urls in DEFAULT_RPC_URLS.items():
+            override = os.getenv(f"RPC_URLS_{network.upper()}")
+            urls_by_network[network] = [u.strip() for u in override.split(",") if u.strip()] if override else default_urls
+        return cls(
+            urls_by_network,
+            timeout=float(os.getenv("RPC_TIMEOUT_SECONDS", "10")),
+            cooldown=float(os.getenv("RPC_ENDPOINT_COOLDOWN_SECONDS", "30")),
+        )
+
+    async def get_session(self):
+        """Return the shared aiohttp session, creating it on first use inside the running loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def pool(self, network):
+        try:
+            return self.pools[network.lower()]
+        except KeyError:
+            raise RpcError(f"No RPC endpoints configured for network '{network}'")
+
+    async def call(self, network, method, params):
+        return await self.pool(network).call(method, params)
+
+    async def batch(self, network, calls):
+        return await self.pool(network).batch(calls)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Global RPC registry instance
+rpc_registry = RpcRegistry.from_env()
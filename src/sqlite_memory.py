@@ -0,0 +1,452 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+from blob_store import MIN_COMPRESSED_CHARS, blob_ref, decompress_text
+
+from memory_store import infer_session_owner, process_rss_bytes, read_snapshot
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+CREATE TABLE IF NOT EXISTS active_sessions (
+    user_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_id TEXT,
+    timestamp TEXT NOT NULL,
+    user_query TEXT,
+    agent_response TEXT,
+    context TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, timestamp);
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    search_term TEXT,
+    results_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_searches_session ON searches (session_id, id);
+CREATE TABLE IF NOT EXISTS preferences (
+    session_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (session_id, key)
+);
+CREATE TABLE IF NOT EXISTS payment_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_id TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_session ON payment_requests (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_user ON payment_requests (user_id);
+CREATE TABLE IF NOT EXISTS tool_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    args TEXT,
+    result TEXT,
+    result_ref TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tool_calls_session ON tool_calls (session_id, id);
+CREATE TABLE IF NOT EXISTS blobs (
+    ref TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+# Statements are kept as module constants so sqlite3's statement cache reuses
+# the prepared form on every call
+INSERT_SESSION = "INSERT OR IGNORE INTO sessions (session_id, user_id, created_at) VALUES (?, ?, ?)"
+CLAIM_SESSION = "UPDATE sessions SET user_id = ? WHERE session_id = ? AND user_id IS NULL"
+SELECT_SESSION = "SELECT user_id, created_at FROM sessions WHERE session_id = ?"
+SELECT_USER_SESSIONS = "SELECT session_id FROM sessions WHERE user_id = ? ORDER BY created_at"
+SELECT_ACTIVE_SESSION = (
+    "SELECT a.session_id FROM active_sessions a JOIN sessions s ON s.session_id = a.session_id "
+    "WHERE a.user_id = ?"
+)
+UPSERT_ACTIVE_SESSION = (
+    "INSERT INTO active_sessions (user_id, session_id) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET session_id = excluded.session_id"
+)
+INSERT_CONVERSATION = (
+    "INSERT INTO conversations (session_id, user_id, timestamp, user_query, agent_response, context) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+TRIM_CONVERSATIONS = (
+    "DELETE FROM conversations WHERE session_id = ? AND id <= "
+    "(SELECT id FROM conversations WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)"
+)
+SELECT_SESSION_CONVERSATIONS = (
+    "SELECT timestamp, user_query, agent_response, context FROM conversations "
+    "WHERE session_id = ? ORDER BY id"
+)
+SELECT_USER_CONVERSATIONS = (
+    "SELECT session_id, timestamp, user_query, agent_response FROM conversations "
+    "WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?"
+)
+INSERT_SEARCH = "INSERT INTO searches (session_id, timestamp, search_term, results_count) VALUES (?, ?, ?, ?)"
+TRIM_SEARCHES = (
+    "DELETE FROM searches WHERE session_id = ? AND id <= "
+    "(SELECT id FROM searches WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)"
+)
+SELECT_SEARCHES = "SELECT timestamp, search_term, results_count FROM searches WHERE session_id = ? ORDER BY id"
+UPSERT_PREFERENCE = (
+    "INSERT INTO preferences (session_id, key, value) VALUES (?, ?, ?) "
+    "ON CONFLICT(session_id, key) DO UPDATE SET value = excluded.value"
+)
+SELECT_PREFERENCES = "SELECT key, value FROM preferences WHERE session_id = ?"
+INSERT_PAYMENT_REQUEST = "INSERT INTO payment_requests (session_id, user_id, timestamp, data) VALUES (?, ?, ?, ?)"
+SELECT_PAYMENT_REQUESTS = "SELECT data FROM payment_requests WHERE session_id = ? ORDER BY id"
+SELECT_PAYMENT_REQUEST_BY_ID = (
+    "SELECT id, data FROM payment_requests WHERE session_id = ? AND json_extract(data, '$.payment_id') = ?"
+)
+UPDATE_PAYMENT_REQUEST = "UPDATE payment_requests SET data = ? WHERE id = ?"
+INSERT_TOOL_CALL = "INSERT INTO tool_calls (session_id, timestamp, tool, args, result, result_ref) VALUES (?, ?, ?, ?, ?, ?)"
+TRIM_TOOL_CALLS = (
+    "DELETE FROM tool_calls WHERE session_id = ? AND id <= "
+    "(SELECT id FROM tool_calls WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)"
+)
+SELECT_TOOL_CALLS = "SELECT timestamp, tool, args, result, result_ref FROM tool_calls WHERE session_id = ? ORDER BY id"
+INSERT_BLOB = "INSERT OR IGNORE INTO blobs (ref, data) VALUES (?, ?)"
+SELECT_BLOB = "SELECT data FROM blobs WHERE ref = ?"
+SELECT_SWEEP_SESSIONS = "SELECT rowid, session_id, user_id, created_at FROM sessions WHERE rowid > ? ORDER BY rowid LIMIT ?"
+SELECT_LAST_ACTIVE = (
+    "SELECT MAX(ts) FROM (SELECT MAX(timestamp) AS ts FROM conversations WHERE session_id = ? "
+    "UNION ALL SELECT MAX(timestamp) FROM searches WHERE session_id = ?)"
+)
+SELECT_SESSION_PAYMENTS = "SELECT id, data FROM payment_requests WHERE session_id = ? ORDER BY id"
+DELETE_PAYMENT_REQUEST = "DELETE FROM payment_requests WHERE id = ?"
+DELETE_SESSION_ROWS = [
+    "DELETE FROM conversations WHERE session_id = ?",
+    "DELETE FROM searches WHERE session_id = ?",
+    "DELETE FROM preferences WHERE session_id = ?",
+    "DELETE FROM payment_requests WHERE session_id = ?",
+    "DELETE FROM tool_calls WHERE session_id = ?",
+    "DELETE FROM active_sessions WHERE session_id = ?",
+    "DELETE FROM sessions WHERE session_id = ?",
+]
+
+MAX_CONVERSATIONS_PER_SESSION = 15
+MAX_SEARCHES_PER_SESSION = 20
+MAX_TOOL_CALLS_PER_SESSION = 15
+
+
+def pack_response(text):
+    """Long agent replies are stored zlib-compressed as a BLOB, like the journal backend's agent_response_z."""
+    if text and len(text) >= MIN_COMPRESSED_CHARS:
+        return zlib.compress(text.encode(), 6)
+    return text
+
+
+def unpack_response(value):
+    return zlib.decompress(value).decode() if isinstance(value, bytes) else value
+
+
+class SqliteConversationMemory:
+    """ConversationMemory backed by SQLite so several server processes can share one store.
+
+    Exposes the same methods as ConversationMemory but keeps nothing in RAM:
+    every call is an indexed query against the database, which runs in WAL
+    mode so readers in other workers never block the writer.
+    """
+
+    def __init__(self, db_path="conversation_memory.db", migrate_from=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._sweep_rowid = 0  # Where the retention sweeper resumes in the sessions table
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        if migrate_from:
+            self.migrate_json_memory(migrate_from)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Close this thread's database connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def migrate_json_memory(self, json_path):
+        """One-shot import of a conversation_memory.json file into the database."""
+        conn = self._connect()
+        if conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone():
+            return
+        if not os.path.exists(json_path):
+            return
+
+        memory = read_snapshot(json_path)
+        with conn:
+            for session_id, session_data in memory.items():
+                user_id = infer_session_owner(session_id, session_data)
+                conn.execute(INSERT_SESSION, (
+                    session_id, user_id, session_data.get("created_at", datetime.now().isoformat())
+                ))
+                conn.executemany(INSERT_CONVERSATION, [
+                    (session_id, user_id, conv["timestamp"], conv["user_query"],
+                     pack_response(decompress_text(conv["agent_response_z"]) if "agent_response_z" in conv
+                                   else conv["agent_response"]),
+                     json.dumps(conv.get("context")))
+                    for conv in session_data.get("conversation_history", [])
+                ])
+                conn.executemany(INSERT_SEARCH, [
+                    (session_id, search["timestamp"], search["search_term"], search["results_count"])
+                    for search in session_data.get("past_searches", [])
+                ])
+                conn.executemany(UPSERT_PREFERENCE, [
+                    (session_id, key, json.dumps(value))
+                    for key, value in session_data.get("user_preferences", {}).items()
+                ])
+                conn.executemany(INSERT_PAYMENT_REQUEST, [
+                    (session_id, payment.get("user_id", user_id), payment.get("timestamp"), json.dumps(payment))
+                    for payment in session_data.get("payment_requests", [])
+                ])
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (json_path,))
+        print(f"Migrated {len(memory)} sessions from {json_path} into {self.db_path}")
+
+    def _ensure_session(self, conn, session_id, user_id=None):
+        conn.execute(INSERT_SESSION, (session_id, user_id, datetime.now().isoformat()))
+        if user_id:
+            conn.execute(CLAIM_SESSION, (user_id, session_id))
+
+    def _session_owner(self, conn, session_id):
+        row = conn.execute(SELECT_SESSION, (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_or_create_session_for_user(self, user_id, current_context_id=None):
+        """Get existing session for user or create new one."""
+        conn = self._connect()
+        row = conn.execute(SELECT_ACTIVE_SESSION, (user_id,)).fetchone()
+        if row:
+            return row[0]
+
+        if current_context_id:
+            session_id = current_context_id
+        else:
+            session_id = f"{user_id}_{int(datetime.now().timestamp())}"
+
+        self.set_active_session(user_id, session_id)
+        return session_id
+
+    def set_active_session(self, user_id, session_id):
+        """Make session_id the current session for user_id."""
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id, user_id)
+            conn.execute(UPSERT_ACTIVE_SESSION, (user_id, session_id))
+
+    def get_session_memory(self, session_id):
+        """Get memory for a specific session."""
+        conn = self._connect()
+        row = conn.execute(SELECT_SESSION, (session_id,)).fetchone()
+        session = {
+            "conversation_history": [
+                {"timestamp": ts, "user_query": query, "agent_response": unpack_response(response),
+                 "context": json.loads(context)}
+                for ts, query, response, context in conn.execute(SELECT_SESSION_CONVERSATIONS, (session_id,))
+            ],
+            "user_preferences": {
+                key: json.loads(value) for key, value in conn.execute(SELECT_PREFERENCES, (session_id,))
+            },
+            "past_searches": [
+                {"timestamp": ts, "search_term": term, "results_count": count}
+                for ts, term, count in conn.execute(SELECT_SEARCHES, (session_id,))
+            ],
+            "payment_requests": [
+                json.loads(data) for (data,) in conn.execute(SELECT_PAYMENT_REQUESTS, (session_id,))
+            ],
+            "created_at": row[1] if row else datetime.now().isoformat(),
+        }
+        tool_calls = []
+        for ts, tool, args, result, result_ref in conn.execute(SELECT_TOOL_CALLS, (session_id,)):
+            call = {"timestamp": ts, "tool": tool, "args": json.loads(args)}
+            if result_ref:
+                call["result_ref"] = result_ref
+            else:
+                call["result"] = result
+            tool_calls.append(call)
+        if tool_calls:
+            session["tool_calls"] = tool_calls
+        if row and row[0]:
+            session["user_id"] = row[0]
+        return session
+
+    def get_user_sessions(self, user_id):
+        """Get the session ids that belong to a user, oldest first."""
+        return [session_id for (session_id,) in self._connect().execute(SELECT_USER_SESSIONS, (user_id,))]
+
+    def get_user_conversation_history(self, user_id, limit=5):
+        """Get recent conversation history across all sessions for a user."""
+        history = []
+        for session_id, ts, query, response in self._connect().execute(SELECT_USER_CONVERSATIONS, (user_id, limit)):
+            response = unpack_response(response)
+            history.append({
+                "session_id": session_id,
+                "timestamp": ts,
+                "user_query": query,
+                "agent_response": response[:100] + "..." if len(response) > 100 else response
+            })
+        return history
+
+    def update_session_memory(self, session_id, user_query, agent_response, context=None):
+        """Update memory for a session."""
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id, (context or {}).get("user_id"))
+            user_id = self._session_owner(conn, session_id)
+            conn.execute(INSERT_CONVERSATION, (
+                session_id, user_id, datetime.now().isoformat(), user_query, pack_response(agent_response),
+                json.dumps(context)
+            ))
+            conn.execute(TRIM_CONVERSATIONS, (session_id, session_id, MAX_CONVERSATIONS_PER_SESSION))
+
+    def add_user_preference(self, session_id, preference_key, preference_value):
+        """Add or update user preference."""
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id)
+            conn.execute(UPSERT_PREFERENCE, (session_id, preference_key, json.dumps(preference_value)))
+
+    def add_search_history(self, session_id, search_term, results_count):
+        """Add to search history."""
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id)
+            conn.execute(INSERT_SEARCH, (session_id, datetime.now().isoformat(), search_term, results_count))
+            conn.execute(TRIM_SEARCHES, (session_id, session_id, MAX_SEARCHES_PER_SESSION))
+
+    def add_payment_request(self, session_id, payment_data):
+        """Add payment request to memory."""
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id)
+            conn.execute(INSERT_PAYMENT_REQUEST, (
+                session_id,
+                payment_data.get("user_id") or self._session_owner(conn, session_id),
+                payment_data.get("timestamp"),
+                json.dumps(payment_data),
+            ))
+
+    def record_tool_call(self, session_id, tool_name, args, result):
+        """Record a tool call as (tool, args, result reference); large results are stored once in the blobs table."""
+        result_ref = None
+        conn = self._connect()
+        with conn:
+            self._ensure_session(conn, session_id)
+            if len(result) >= MIN_COMPRESSED_CHARS:
+                result_ref = blob_ref(result)
+                conn.execute(INSERT_BLOB, (result_ref, zlib.compress(result.encode(), 6)))
+                result = None
+            conn.execute(INSERT_TOOL_CALL, (
+                session_id, datetime.now().isoformat(), tool_name, json.dumps(args), result, result_ref
+            ))
+            conn.execute(TRIM_TOOL_CALLS, (session_id, session_id, MAX_TOOL_CALLS_PER_SESSION))
+
+    def get_tool_result(self, call):
+        """Return the full result text of a recorded tool call."""
+        if "result_ref" not in call:
+            return call.get("result")
+        row = self._connect().execute(SELECT_BLOB, (call["result_ref"],)).fetchone()
+        return zlib.decompress(row[0]).decode() if row else None
+
+    def update_payment_request(self, session_id, payment_id, updates):
+        """Update a stored payment request in place; returns False if it was not found."""
+        conn = self._connect()
+        with conn:
+            # Take the write lock before reading, so another worker cannot update the row in between
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(SELECT_PAYMENT_REQUEST_BY_ID, (session_id, payment_id)).fetchone()
+            if row is None:
+                return False
+            payment = json.loads(row[1])
+            payment.update(updates)
+            conn.execute(UPDATE_PAYMENT_REQUEST, (json.dumps(payment), row[0]))
+        return True
+
+    def _delete_session(self, conn, session_id, user_id, archive, reason):
+        """Delete a session's rows, archiving its payment records first; the caller holds a transaction."""
+        payments = [json.loads(data) for _, data in conn.execute(SELECT_SESSION_PAYMENTS, (session_id,))]
+        archived = archive.append(session_id, user_id, payments, reason)
+        for statement in DELETE_SESSION_ROWS:
+            conn.execute(statement, (session_id,))
+        return archived
+
+    def sweep(self, policy, archive, limit=200):
+        """Apply a RetentionPolicy to the next `limit` sessions, resuming from a rowid cursor."""
+        counts = {"scanned": 0, "expired_sessions": 0, "trimmed_sessions": 0, "archived_payments": 0}
+        now = datetime.now()
+        conn = self._connect()
+        rows = conn.execute(SELECT_SWEEP_SESSIONS, (self._sweep_rowid, limit)).fetchall()
+        # Start the next round from the beginning once the end of the table is reached
+        self._sweep_rowid = rows[-1][0] if len(rows) == limit else 0
+        for _, session_id, user_id, created_at in rows:
+            counts["scanned"] += 1
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                (last_active,) = conn.execute(SELECT_LAST_ACTIVE, (session_id, session_id)).fetchone()
+                if policy.session_expired(last_active or created_at, now):
+                    counts["archived_payments"] += self._delete_session(conn, session_id, user_id, archive, "session_expired")
+                    counts["expired_sessions"] += 1
+                    continue
+
+                archivable = []
+                for row_id, data in conn.execute(SELECT_SESSION_PAYMENTS, (session_id,)).fetchall():
+                    payment = json.loads(data)
+                    if policy.payment_archivable(payment, now):
+                        archivable.append(payment)
+                        conn.execute(DELETE_PAYMENT_REQUEST, (row_id,))
+                counts["archived_payments"] += archive.append(session_id, user_id, archivable, "payment_aged")
+
+                if user_id and policy.max_sessions_per_user:
+                    sessions = self.get_user_sessions(user_id)
+                    if len(sessions) > policy.max_sessions_per_user:
+                        active = conn.execute(SELECT_ACTIVE_SESSION, (user_id,)).fetchone()
+                        older = [sid for sid in sessions if not active or sid != active[0]]
+                        for old_session in older[:len(sessions) - policy.max_sessions_per_user]:
+                            counts["archived_payments"] += self._delete_session(
+                                conn, old_session, user_id, archive, "session_limit"
+                            )
+                            counts["trimmed_sessions"] += 1
+        return counts
+
+    def memory_stats(self):
+        """Counters for the memory metrics endpoint; nothing is resident, so only the stored size varies."""
+        (stored,) = self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return {
+            "backend": type(self).__name__,
+            "paging": True,
+            "stored_sessions": stored,
+            "resident_sessions": 0,
+            "rss_bytes": process_rss_bytes(),
+        }
@@ -0,0 +1,137 @@
+import base64
+import json
+from typing import List, Optional, TypedDict
+
+
+# TOOL_OUTPUT_FORMAT values: markdown prose for the model to quote, or compact JSON
+# for the model to render once in its final answer
+OUTPUT_FORMATS = ("markdown", "json")
+
+ITEM_FIELDS = ("id", "name", "category", "price", "stock")
+
+# Upper bound on items returned by one call, whatever limit the model asks for
+MAX_PAGE_SIZE = 100
+
+
+class ItemPage(TypedDict):
+    """Items as rows of values in ``fields`` order, so keys are not repeated per item."""
+    fields: List[str]
+    rows: List[list]
+    total: Optional[int]  # None for search results, where only the ranked prefix is computed
+    next_cursor: Optional[str]
+
+
+class NetworkResult(TypedDict):
+    network: str
+    name: str
+    chain_id: int
+    fee: str
+    confirmation_time: str
+
+
+class NetworksResult(TypedDict):
+    networks: List[NetworkResult]
+    recommended: str
+
+
+class PaymentInfoResult(TypedDict, total=False):
+    network: str
+    chain_id: int
+    currency: str
+    wallet_address: str
+    usdc_contract: str
+    minimum_payment: float
+    payment_timeout: str
+    payment_id: str
+    amount_due: float
+    reserved: dict
+    expires_at: str
+
+
+def parse_fields(fields):
+    """Turn a comma-separated field list into a tuple of item fields; empty selects all."""
+    if not fields:
+        return ITEM_FIELDS
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in ITEM_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(ITEM_FIELDS)}")
+    return selected
+
+
+def decode_cursor(cursor):
+    """Return the offset a cursor from a previous page points at (0 for the first page)."""
+    if not cursor:
+        return 0
+    try:
+        offset = int(cursor)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return offset
+
+
+def clamp_limit(limit):
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page_bounds(cursor, limit):
+    """Return (offset, limit) for a page request, with the limit clamped to 1..MAX_PAGE_SIZE."""
+    return decode_cursor(cursor), clamp_limit(limit)
+
+
+def build_page(items, available, fields=ITEM_FIELDS, total=None, next_cursor=None):
+    """Build an ItemPage from the items on one page, with stock taken from available(item_id)."""
+    rows = []
+    for item in items:
+        values = {"id": item["id"], "name": item["name"], "category": item.get("category", ""), "price": item["price"]}
+        if "stock" in fields:
+            values["stock"] = available(item["id"])
+        rows.append([values[field] for field in fields])
+    return {"fields": list(fields), "rows": rows, "total": total, "next_cursor": next_cursor}
+
+
+def item_page(items, available, fields=ITEM_FIELDS, cursor="", limit=50, known_total=True):
+    """Slice one page out of a list of items using an offset cursor.
+
+    Pass known_total=False when items is only the ranked prefix needed to
+    fill this page, so no total is reported.
+    """
+    offset, limit = page_bounds(cursor, limit)
+    page = items[offset:offset + limit]
+    end = offset + len(page)
+    return build_page(
+        page, available, fields,
+        total=len(items) if known_total else None,
+        next_cursor=str(end) if end < len(items) else None,
+    )
+
+
+def encode_key_cursor(sort, key):
+    """Opaque cursor resuming a sorted listing after the item with this sort key."""
+    return base64.urlsafe_b64encode(json.dumps([sort, *key], separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_key_cursor(cursor, sort):
+    """Return the sort key a cursor resumes after, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, *key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor was issued for sort={cursor_sort}, not sort={sort}")
+    return tuple(key)
+
+
+def page_items(page):
+    """Expand a page's rows back into item dicts."""
+    return [dict(zip(page["fields"], row)) for row in page["rows"]]
+
+
+def to_json(result):
+    """Serialize a result without whitespace, e.g. for storing it in conversation history."""
+    return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
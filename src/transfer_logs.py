@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+def to_hex(value):
+    """Normalize a str, bytes or HexBytes value to a lowercase 0x-prefixed hex string."""
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    value = value.lower()
+    return value if value.startswith("0x") else "0x" + value
+
+
+def address_topic(address):
+    """Left-pad an address to a 32-byte log topic."""
+    return "0x" + address.lower()[2:].rjust(64, "0")
+
+
+def decode_transfers(logs, token_address=None):
+    """Decode ERC-20 Transfer events from a receipt's logs or an eth_getLogs result.
+
+    Works on raw JSON-RPC dicts and on web3 AttributeDicts with HexBytes
+    fields. Logs from other contracts or with a different event signature
+    are dropped before any decoding. Returns a list of dicts with token,
+    from, to, amount (raw integer units), tx_hash and log_index.
+    """
+    token_address = token_address.lower() if token_address else None
+    transfers = []
+    for log in logs:
+        topics = log["topics"]
+        if len(topics) < 3:
+            continue
+        if to_hex(topics[0]) != TRANSFER_TOPIC:
+            continue
+        address = to_hex(log["address"])
+        if token_address and address != token_address:
+            continue
+        data = to_hex(log["data"])
+        transfers.append({
+            "token": address,
+            "from": "0x" + to_hex(topics[1])[-40:],
+            "to": "0x" + to_hex(topics[2])[-40:],
+            "amount": int(data, 16) if data != "0x" else 0,
+            "tx_hash": to_hex(log["transactionHash"]) if log.get("transactionHash") is not None else None,
+            "log_index": log.get("logIndex"),
+        })
+    return transfers
+
+
+def index_by_recipient(transfers):
+    """Group decoded transfers by recipient address in a single pass."""
+    by_recipient = defaultdict(list)
+    for transfer in transfers:
+        by_recipient[transfer["to"]].append(transfer)
+    return by_recipient
+
+
+def total_received(logs, token_address, recipient):
+    """Sum every transfer of token_address to recipient, e.g. a payment split across several transfers."""
+    transfers = index_by_recipient(decode_transfers(logs, token_address)).get(recipient.lower(), [])
+    return sum(transfer["amount"] for transfer in transfers)